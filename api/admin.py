@@ -15,10 +15,12 @@ from .models import (
     Document,
     DataFormat,
     Identity,
+    Job,
     Metadata,
     MetadataContact,
     Order,
     OrderItem,
+    OutgoingEmail,
     Pricing,
     Product,
     ProductFormat,
@@ -70,6 +72,22 @@ class DataFormatAdmin(CustomModelAdmin):
     model = DataFormat
 
 
+class JobAdmin(CustomModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after', 'date_created', 'date_finished']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'dedupe_key']
+    readonly_fields = ['date_created', 'date_finished', 'locked_by', 'locked_until', 'last_error']
+    ordering = ['-id']
+
+
+class OutgoingEmailAdmin(CustomModelAdmin):
+    list_display = ['id', 'recipient', 'subject', 'status', 'attempts', 'next_attempt', 'date_sent']
+    list_filter = ['status']
+    search_fields = ['recipient', 'subject']
+    readonly_fields = ['date_created', 'date_sent', 'last_error', 'dedupe_key']
+    ordering = ['-id']
+
+
 class MetadataAdmin(CustomModelAdmin):
     save_as = True
     inlines = [MetadataContactInline]
@@ -163,6 +181,7 @@ class OrderAdmin(CustomGeoModelAdmin):
             for item in obj.items.all():
                 item.extract_result = None
                 item.status = OrderItem.OrderItemStatus.PENDING
+                item.extract_lease_expiry = None
                 item.save()
             obj.extract_result = None
             obj.order_status = Order.OrderStatus.READY
@@ -287,6 +306,8 @@ admin.site.register(Copyright)
 admin.site.register(Document, DocumentAdmin)
 admin.site.register(DataFormat)
 admin.site.register(Identity, AbstractIdentityAdmin)
+admin.site.register(Job, JobAdmin)
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
 admin.site.register(Contact, ContactAdmin)
 admin.site.register(Metadata, MetadataAdmin)
 admin.site.register(MetadataContact, MetadataContactAdmin)
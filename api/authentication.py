@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .permissions import get_user_access
+
+UserModel = get_user_model()
+
+# Claims describing the user, added to the tokens issued by the API
+USER_CLAIMS = ('username', 'is_staff', 'groups')
+
+
+def set_user_claims(token, user):
+    token['username'] = user.get_username()
+    token['is_staff'] = user.is_staff
+    token['groups'] = sorted(get_user_access(user)['groups'])
+
+
+def load_deferred_fields_together(instance):
+    """
+    Makes the first access to a deferred field of instance load all its deferred
+    fields in one query, instead of one query per field accessed.
+    """
+    refresh_from_db = instance.refresh_from_db
+
+    def load(using=None, fields=None, from_queryset=None):
+        deferred_fields = instance.get_deferred_fields()
+        if fields is not None and deferred_fields and set(fields) <= deferred_fields:
+            fields = deferred_fields
+        refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+
+    instance.refresh_from_db = load
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token carrying the USER_CLAIMS, copied to the access tokens made from it.
+    When user is set, the access tokens get its current claims instead.
+    """
+    user = None
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        set_user_claims(token, user)
+        return token
+
+    @property
+    def access_token(self):
+        access = super().access_token
+        if self.user is not None:
+            set_user_claims(access, self.user)
+        return access
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refreshes the USER_CLAIMS of the access token, the ones of the refresh token
+    are as old as the login
+    """
+
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        # Same as TokenRefreshSerializer.validate, keeping the user it loads
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM, None)
+        if user_id:
+            refresh.user = UserModel.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            if not api_settings.USER_AUTHENTICATION_RULE(refresh.user):
+                raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                try:
+                    refresh.blacklist()
+                except AttributeError:
+                    # Blacklist app not installed
+                    pass
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            refresh.outstand()
+            data['refresh'] = str(refresh)
+
+        return data
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Authenticates with a JWT access token without reading the user from the database.
+
+    The user is built from the claims of the token, its other fields are deferred
+    and all loaded together the first time one of them is accessed. Tokens without
+    the USER_CLAIMS are authenticated as by JWTAuthentication. A deactivated user
+    stays authenticated until the expiry of its access token.
+    """
+
+    def get_user(self, validated_token):
+        if any(claim not in validated_token for claim in USER_CLAIMS) \
+                or api_settings.USER_ID_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        values = {
+            UserModel._meta.get_field(api_settings.USER_ID_FIELD).attname:
+                validated_token[api_settings.USER_ID_CLAIM],
+            UserModel.USERNAME_FIELD: validated_token['username'],
+            'is_staff': validated_token['is_staff'],
+            'is_active': True,
+        }
+        field_names = [field.attname for field in UserModel._meta.concrete_fields if field.attname in values]
+        user = UserModel.from_db(DEFAULT_DB_ALIAS, field_names, [values[name] for name in field_names])
+        load_deferred_fields_together(user)
+        user.token_groups = frozenset(validated_token['groups'])
+        return user
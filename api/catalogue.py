@@ -0,0 +1,198 @@
+"""
+Request-scoped identity map for catalogue objects (products, pricings, formats,
+order types...). These rows rarely change but pricing and confirming an order
+reads them again for every item. Inside a scope, each row is fetched once and
+the same instance is shared; outside a scope every call hits the database.
+
+When CATALOGUE_CACHE_ENABLED is set, catalogue tables are also kept in memory
+by the process between requests. Database triggers give the catalogue a new
+version each time one of its tables changes, the version is read once per scope
+and the tables are reloaded when it differs from the one they were read at.
+This keeps all processes consistent without any message between them.
+Instances taken from the scope or the tables are shared and must not be modified.
+"""
+import contextvars
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from django.apps import apps
+from django.conf import settings
+
+_scope = contextvars.ContextVar('catalogue_scope', default=None)
+
+# Related objects loaded along with the rows of the catalogue tables kept in memory
+CACHED_TABLES = {
+    'api.DataFormat': (),
+    'api.Metadata': (),
+    'api.OrderType': (),
+    'api.Pricing': (),
+    'api.Product': ('metadata', 'pricing', 'provider__identity'),
+}
+
+# Values kept in memory by the process, valid for the catalogue version they were read at
+_cache = {'version': None, 'values': {}}
+_cache_lock = threading.Lock()
+
+
+@contextmanager
+def scope():
+    """
+    Context in which catalogue objects are fetched once. Nested scopes share
+    the outer scope cache.
+    """
+    if _scope.get() is not None:
+        yield
+        return
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def memoize(key, func):
+    """
+    Returns func() computed once per scope for the given key
+    """
+    cache = _scope.get()
+    if cache is None:
+        return func()
+    if key not in cache:
+        cache[key] = func()
+    return cache[key]
+
+
+def last_change():
+    """
+    Returns (version, date) of the last change to the catalogue, read once per scope.
+    None if the catalogue version is missing.
+    """
+    return memoize(('catalogue_version',), _read_version)
+
+
+def _read_version():
+    catalogue_version = apps.get_model('api', 'CatalogueVersion')
+    return catalogue_version.objects.values_list('version', 'date_modified').first()
+
+
+def version():
+    """
+    Returns the catalogue version, read once per scope.
+    None outside a scope or when the catalogue isn't kept in memory.
+    """
+    if _scope.get() is None or not settings.CATALOGUE_CACHE_ENABLED:
+        return None
+    change = last_change()
+    return change[0] if change else None
+
+
+def cached(key, func):
+    """
+    Returns func() kept in memory by the process until the catalogue version changes.
+    func must only depend on catalogue tables. Without a version, falls back to memoize.
+    """
+    current = version()
+    if current is None:
+        return memoize(key, func)
+    with _cache_lock:
+        if _cache['version'] != current:
+            _cache['version'] = current
+            _cache['values'] = {}
+        if key in _cache['values']:
+            return _cache['values'][key]
+    value = func()
+    with _cache_lock:
+        # Don't keep values read while another request reloaded the catalogue
+        if _cache['version'] == current:
+            _cache['values'][key] = value
+    return value
+
+
+def table(model):
+    """
+    Returns all rows of a catalogue table in their default ordering, as a dict
+    keyed by primary key. None if model isn't kept in memory or there's no version.
+    """
+    label = model._meta.label
+    if label not in CACHED_TABLES or version() is None:
+        return None
+
+    def load():
+        queryset = model.objects.select_related(*CACHED_TABLES[label])
+        queryset = queryset.order_by(*model._meta.ordering, 'pk')
+        return {instance.pk: instance for instance in queryset}
+
+    return cached(('table', label), load)
+
+
+def get(model, pk):
+    """
+    Returns the instance of model with primary key pk, None if pk is None
+    """
+    if pk is None:
+        return None
+    rows = table(model)
+    if rows is not None:
+        if pk not in rows:
+            raise model.DoesNotExist()
+        return rows[pk]
+    return memoize((model._meta.label, pk), lambda: model.objects.get(pk=pk))
+
+
+def get_related(instance, field_name):
+    """
+    Returns the object referenced by the foreign key field_name of instance.
+    When it isn't loaded yet, it's taken from the scope and set on instance.
+    """
+    field = instance._meta.get_field(field_name)
+    if field.is_cached(instance):
+        return getattr(instance, field_name)
+    related = get(field.related_model, getattr(instance, field.attname))
+    if related is not None:
+        setattr(instance, field_name, related)
+    return related
+
+
+class LRUCache:
+    """
+    Keeps the maxsize most recently used values in memory, shared by the threads
+    of the process. Keys should include the catalogue version of their value.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._values:
+                return None
+            self._values.move_to_end(key)
+            return self._values[key]
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class CatalogueScopeMiddleware:
+    """
+    Opens a catalogue scope for each request
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with scope():
+            return self.get_response(request)
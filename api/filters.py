@@ -2,7 +2,9 @@ import re
 import unidecode
 
 from django.conf import settings
-from django.contrib.postgres.search import SearchQuery
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
 from django.utils.encoding import force_str
 from django.utils.translation import gettext_lazy as _
 
@@ -19,6 +21,8 @@ class FullTextSearchFilter(BaseFilterBackend):
     template = 'rest_framework/filters/search.html'
     search_title = _('Search')
     search_description = _('A search term.')
+    rank_param = 'rank'
+    rank_description = _('Order results by relevance, label matches first. Paginated with a cursor.')
 
 
     def get_ts_field(self, view, request):
@@ -29,6 +33,14 @@ class FullTextSearchFilter(BaseFilterBackend):
         return getattr(view, 'ts_field', None)
 
 
+    def is_ranked(self, request):
+        """
+        Results are ordered by relevance when ?rank=true is passed with a search term
+        """
+        ranked = request.query_params.get(self.rank_param, '').lower() in ('1', 'true')
+        return ranked and bool(self.get_search_term(request))
+
+
     # Courtesy of
     # https://www.fusionbox.com/blog/detail/partial-word-search-with-postgres-full-text-search-in-django/632/
     def get_search_term(self, request):
@@ -67,6 +79,12 @@ class FullTextSearchFilter(BaseFilterBackend):
 
         kwargs = {ts_field: search_query}
         queryset = queryset.filter(**kwargs)
+        if self.is_ranked(request):
+            # Cast to double precision so the rank of the last row round-trips exactly in cursors.
+            # pk keeps the order stable between pages
+            queryset = queryset.annotate(rank=Cast(SearchRank(
+                F(ts_field), search_query, weights=settings.FTS_RANK_WEIGHTS, cover_density=True
+            ), FloatField())).order_by('-rank', 'pk')
         return queryset
 
 
@@ -83,7 +101,13 @@ class FullTextSearchFilter(BaseFilterBackend):
                     title=force_str(self.search_title),
                     description=force_str(self.search_description)
                 )
-            )
+            ),
+            coreapi.Field(
+                name=self.rank_param,
+                required=False,
+                location='query',
+                schema=coreschema.Boolean(description=force_str(self.rank_description))
+            ),
         ]
 
 
@@ -99,4 +123,13 @@ class FullTextSearchFilter(BaseFilterBackend):
                     'type': 'string',
                 },
             },
+            {
+                'name': self.rank_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(self.rank_description),
+                'schema': {
+                    'type': 'boolean',
+                },
+            },
         ]
@@ -1,15 +1,47 @@
+import copy
+import functools
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import struct
 import uuid
 import zipfile
+from datetime import timedelta
+from html import unescape
 from pathlib import Path
-from multiprocessing import Process
+from django.apps import apps
 from django.conf import settings
-from django.core.mail import send_mail
-from django.template.loader import get_template, render_to_string
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.template.loader import get_template
 from django.utils import timezone, translation
+from django.utils.cache import get_conditional_response
 from django.utils.deconstruct import deconstructible
+from django.utils.html import strip_tags
+from django.utils.http import http_date, parse_etags, quote_etag
 from django.utils.translation import gettext as _
 
+from . import jobs
+
 LANG = settings.LANGUAGE_CODE
+LOGGER = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+NON_TEXT_TAGS_RE = re.compile(r'<(head|style|script)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+
+# Zip merging, see _zip_them_all
+ZIP_COPY_CHUNK_SIZE = 1024 * 1024
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
+ZIP64_EXTRA_ID = 0x0001
+# Formats already compressed, deflating them again costs CPU for nothing
+ZIP_STORED_EXTENSIONS = {
+    '.7z', '.ecw', '.gpkg', '.gz', '.jp2', '.jpeg', '.jpg', '.laz',
+    '.png', '.rar', '.sid', '.tif', '.tiff', '.zip',
+}
 
 @deconstructible
 class RandomFileName(object):
@@ -29,13 +61,60 @@ class RandomFileName(object):
         return current_path
 
 
+@functools.lru_cache(maxsize=None)
+def _get_email_template(template_name):
+    """
+    Compiled email templates, kept for the life of the process.
+    Translations are resolved when rendering so the same template serves all languages.
+    """
+    return get_template('{}.html'.format(template_name))
+
+
+def _html_to_text(html_message):
+    """
+    Plain text alternative of an HTML email
+    """
+    text = unescape(strip_tags(NON_TEXT_TAGS_RE.sub('', html_message)))
+    return BLANK_LINES_RE.sub('\n\n', '\n'.join(line.strip() for line in text.splitlines())).strip()
+
+
 def _render_email_templates(template_name, template_data):
-    html_template_name = '{}.html'.format(template_name)
-    template_data['REPLY_TO_EMAIL'] = settings.REPLY_TO_EMAIL
-    return (
-        render_to_string(html_template_name, template_data),
-        get_template(html_template_name).render(template_data),
-    )
+    """
+    Renders the HTML template once, returns the plain text and HTML bodies
+    """
+    html_message = _get_email_template(template_name).render(
+        dict(template_data, REPLY_TO_EMAIL=settings.REPLY_TO_EMAIL))
+    return (_html_to_text(html_message), html_message)
+
+
+def _render_email(subject, message, template_name, template_data, language):
+    """
+    Translates the subject and renders the email in the given language,
+    returns the subject, plain text and HTML bodies
+    """
+    currentLanguage = translation.get_language()
+    html_message = None
+    try:
+        if language:
+          translation.activate(language)
+        if subject:
+          subject = _(subject)
+        if template_name:
+            if template_data is None:
+                template_data = {'messages': [message]}
+            (message, html_message) = _render_email_templates(template_name, template_data)
+    finally:
+        if language:
+          translation.activate(currentLanguage)
+    return subject, message, html_message
+
+
+def _get_recipient_email(recipient):
+    if recipient is None:
+        return settings.ADMIN_EMAIL_LIST
+    if isinstance(recipient, str):
+        return recipient
+    return recipient.email
 
 
 def send_geoshop_email(subject, message='', recipient=None, template_name=None, template_data=None, language=None):
@@ -58,26 +137,12 @@ def send_geoshop_email(subject, message='', recipient=None, template_name=None,
         A Dict containing data for the provided template name. Ignored if template_name
         is not given.
     """
-    currentLanguage = translation.get_language()
-    try:
-        if language:
-          translation.activate(language)
-        if subject:
-          subject = _(subject)
-        if template_name:
-            if template_data is None:
-                template_data = {'messages': [message]}
-            (message, html_message) = _render_email_templates(template_name, template_data)
-    finally:
-        if language:
-          translation.activate(currentLanguage)
-
-    if recipient is None:
-        recipient_list = [settings.ADMIN_EMAIL_LIST]
-    elif isinstance(recipient, str):
-        recipient_list = [recipient]
-    else:
-        recipient_list = [recipient.email]
+    subject, message, html_message = _render_email(
+        subject, message, template_name, template_data, language)
+    recipient_list = [_get_recipient_email(recipient)]
+    if settings.EMAIL_OUTBOX_ENABLED:
+        queue_email(subject, message, recipient_list, html_message)
+        return
     send_mail(
         subject,
         message,
@@ -87,6 +152,112 @@ def send_geoshop_email(subject, message='', recipient=None, template_name=None,
         fail_silently=False,
     )
 
+
+def send_geoshop_bulk_email(subject, recipients, message='', template_name=None, template_data=None, language=None):
+    """
+    Sends the same email to many recipients, each one receiving its own copy.
+    The email is rendered once and sent over a single connection (or queued at once
+    in the outbox), which makes mass notifications cheap.
+    Parameters are the ones of send_geoshop_email, recipients being a list of recipients.
+    Returns the number of emails sent or queued.
+    """
+    subject, message, html_message = _render_email(
+        subject, message, template_name, template_data, language)
+    recipient_list = list(dict.fromkeys(_get_recipient_email(recipient) for recipient in recipients))
+    if not recipient_list:
+        return 0
+    if settings.EMAIL_OUTBOX_ENABLED:
+        queue_email(subject, message, recipient_list, html_message)
+        return len(recipient_list)
+    connection = get_connection(fail_silently=False)
+    emails = []
+    for recipient_email in recipient_list:
+        email = EmailMultiAlternatives(
+            subject, message, settings.DEFAULT_FROM_EMAIL, [recipient_email], connection=connection)
+        if html_message:
+            email.attach_alternative(html_message, 'text/html')
+        emails.append(email)
+    return connection.send_messages(emails)
+
+
+def _outgoing_email_model():
+    # models imports helpers, so OutgoingEmail cannot be imported here
+    return apps.get_model('api', 'OutgoingEmail')
+
+
+def queue_email(subject, message, recipient_list, html_message=None):
+    """
+    Stores an email in the outbox, one row per recipient, to be sent by the workers.
+    The same email is not queued twice for a recipient while it's not sent yet.
+    """
+    OutgoingEmail = _outgoing_email_model()
+    emails = []
+    for recipient in recipient_list:
+        dedupe_key = hashlib.sha256('\0'.join(
+            [recipient, subject, message, html_message or '']).encode()).hexdigest()
+        emails.append(OutgoingEmail(
+            subject=subject,
+            message=message,
+            html_message=html_message or '',
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient=recipient,
+            dedupe_key=dedupe_key,
+        ))
+    OutgoingEmail.objects.bulk_create(emails, ignore_conflicts=True)
+
+
+def flush_email_outbox(batch_size=None):
+    """
+    Sends due emails of the outbox over a single SMTP connection and returns
+    the number of emails sent. Failed emails are retried with an exponential delay
+    until EMAIL_OUTBOX_MAX_ATTEMPTS is reached.
+    """
+    OutgoingEmail = _outgoing_email_model()
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+            status=OutgoingEmail.OutgoingEmailStatus.PENDING,
+            next_attempt__lte=now
+        ).order_by('next_attempt', 'id')[:batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE])
+        if not emails:
+            return 0
+        sent = 0
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+            for email in emails:
+                try:
+                    connection.send_messages([email.to_message(connection)])
+                except Exception as error:
+                    _email_failed(email, error)
+                else:
+                    email.status = OutgoingEmail.OutgoingEmailStatus.SENT
+                    email.attempts += 1
+                    email.date_sent = timezone.now()
+                    sent += 1
+        except Exception as error:
+            # Server unreachable, every email of the batch waits for the next attempt
+            LOGGER.exception('Cannot connect to mail server')
+            for email in emails:
+                if email.status == OutgoingEmail.OutgoingEmailStatus.PENDING:
+                    _email_failed(email, error)
+        finally:
+            connection.close()
+        OutgoingEmail.objects.bulk_update(
+            emails, ['status', 'attempts', 'next_attempt', 'last_error', 'date_sent'])
+    return sent
+
+
+def _email_failed(email, error):
+    LOGGER.warning('Sending email %s failed: %s', email.pk, error)
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = email.OutgoingEmailStatus.FAILED
+    else:
+        email.next_attempt = timezone.now() + timedelta(
+            seconds=settings.EMAIL_OUTBOX_RETRY_DELAY * 2 ** (email.attempts - 1))
+
 def _rename_duplicate_file(filenames_dict, filename):
     """
     Keeps track of filenames in a filenames_dict and counts number of
@@ -104,48 +275,231 @@ def _rename_duplicate_file(filenames_dict, filename):
     return filenames_dict, final_name
 
 
+def _copy_zip_member(source_zip, info, target_zip, arcname):
+    """
+    Copies a member of source_zip into target_zip as raw compressed bytes,
+    without decompressing and compressing it again. Data is copied by chunks.
+    """
+    new_info = copy.copy(info)
+    new_info.filename = arcname
+    new_info.orig_filename = arcname
+    # Sizes and CRC are known, they go in the local header instead of a data descriptor
+    new_info.flag_bits &= ~ZIP_DATA_DESCRIPTOR_FLAG
+    # ZIP64 sizes are written again by FileHeader when needed
+    new_info.extra = zipfile._strip_extra(info.extra, (ZIP64_EXTRA_ID,))
+
+    # Local header of the source member has its own filename and extra lengths
+    source_zip.fp.seek(info.header_offset)
+    local_header = struct.unpack(zipfile.structFileHeader, source_zip.fp.read(zipfile.sizeFileHeader))
+    source_zip.fp.seek(
+        local_header[zipfile._FH_FILENAME_LENGTH] + local_header[zipfile._FH_EXTRA_FIELD_LENGTH],
+        os.SEEK_CUR)
+
+    target_fp = target_zip.fp
+    new_info.header_offset = target_fp.tell()
+    target_fp.write(new_info.FileHeader(
+        new_info.file_size > zipfile.ZIP64_LIMIT or new_info.compress_size > zipfile.ZIP64_LIMIT))
+    remaining = info.compress_size
+    while remaining > 0:
+        chunk = source_zip.fp.read(min(ZIP_COPY_CHUNK_SIZE, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile('Truncated member {} in {}'.format(info.filename, source_zip.filename))
+        target_fp.write(chunk)
+        remaining -= len(chunk)
+
+    target_zip.filelist.append(new_info)
+    target_zip.NameToInfo[arcname] = new_info
+    target_zip.start_dir = target_fp.tell()
+    target_zip._didModify = True
+
+
 def _zip_them_all(full_zip_path, files_list_path):
     """
     Takes a list of zip paths and brings the content together in a single zip.
     If duplicate names are detected, it will rename the files.
+    Members of zips are copied as they are compressed, loose files that are
+    already compressed (images, LAZ, GeoPackages...) are stored as is.
     """
-    full_zip_file = zipfile.ZipFile(full_zip_path, 'w', zipfile.ZIP_DEFLATED)
+    full_zip_file = zipfile.ZipFile(full_zip_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
     filenames_dict = {}
     for file_path in files_list_path:
         if file_path.endswith(".zip"):
-            zip_file = zipfile.ZipFile('{}/{}'.format(settings.MEDIA_ROOT, file_path), 'r')
-            for unzipped_file in zip_file.namelist():
-                filenames_dict, final_name = _rename_duplicate_file(filenames_dict, unzipped_file)
-                full_zip_file.writestr(final_name, zip_file.open(unzipped_file).read())
+            with zipfile.ZipFile('{}/{}'.format(settings.MEDIA_ROOT, file_path), 'r') as zip_file:
+                for info in zip_file.infolist():
+                    filenames_dict, final_name = _rename_duplicate_file(filenames_dict, info.filename)
+                    _copy_zip_member(zip_file, info, full_zip_file, final_name)
 
         elif file_path != '':
             filenames_dict, final_name = _rename_duplicate_file(filenames_dict, Path(file_path).name)
+            compression = zipfile.ZIP_DEFLATED
+            if Path(file_path).suffix.lower() in ZIP_STORED_EXTENSIONS:
+                compression = zipfile.ZIP_STORED
             full_zip_file.write(
                 '{}/{}'.format(settings.MEDIA_ROOT, file_path),
-                final_name)
+                final_name,
+                compress_type=compression)
 
     full_zip_file.close()
 
 
+def _order_item_files(order_id):
+    order_item = apps.get_model('api', 'OrderItem')
+    return [
+        name for name in order_item.objects.filter(order_id=order_id).order_by('id').values_list(
+            'extract_result', flat=True)
+        if name
+    ]
+
+
+@jobs.register('zip_order')
+def _zip_order_job(full_zip_path, order_id=None, files_list_path=None):
+    """
+    Job building the zip of a whole order. The zip is written under a name of its
+    own and moved in place once complete, so a partial zip is never offered for
+    download and two runs of the job (expired lease) never write the same file.
+
+    Files are listed when the job runs so items delivered while the job was pending
+    are included, and the order is zipped again if items changed while zipping.
+    """
+    full_zip_path = Path(full_zip_path)
+    full_zip_path.parent.mkdir(parents=True, exist_ok=True)
+    if order_id is None:
+        # Job enqueued with its list of files
+        files_list = files_list_path
+    else:
+        files_list = _order_item_files(order_id)
+    while True:
+        partial_zip_path = full_zip_path.with_name(
+            '{}.{}.part'.format(full_zip_path.name, uuid.uuid4().hex))
+        try:
+            _zip_them_all(partial_zip_path, files_list)
+            os.replace(partial_zip_path, full_zip_path)
+        finally:
+            if partial_zip_path.exists():
+                partial_zip_path.unlink()
+        if order_id is None:
+            return
+        current_files_list = _order_item_files(order_id)
+        if current_files_list == files_list:
+            return
+        files_list = current_files_list
+
+
 def zip_all_orderitems(order):
     """
     Takes all zips'content from order items and makes one single zip of it
-    calling _zip_them_all as a backgroud process.
+    calling _zip_them_all in a background job.
+    The zip of an order keeps its path when the order is zipped again.
     """
     itemFiles = [item for item in order.items.all() if item.extract_result.name]
 
-    today = timezone.now()
-    first_part = str(uuid.uuid4())[0:9]
-    zip_path = Path(
-        'extract',
-        str(today.year), str(today.month),
-        "{}{}.zip".format(first_part, str(order.id)))
-    order.extract_result.name = zip_path.as_posix()
-    order.extract_result_size = sum(item.extract_result.size for item in itemFiles)
+    zip_path = order.extract_result.name
+    if not zip_path:
+        today = timezone.now()
+        first_part = str(uuid.uuid4())[0:9]
+        zip_path = Path(
+            'extract',
+            str(today.year), str(today.month),
+            "{}{}.zip".format(first_part, str(order.id))).as_posix()
     full_zip_path = Path(settings.MEDIA_ROOT, zip_path)
 
-    back_process = Process(target=_zip_them_all, args=(full_zip_path, [
-        item.extract_result.name for item in itemFiles
-    ]))
-    back_process.daemon = True
-    back_process.start()
+    job = jobs.enqueue(
+        'zip_order',
+        payload={
+            'full_zip_path': str(full_zip_path),
+            'order_id': order.id,
+        },
+        dedupe_key='zip_order_{}'.format(order.id),
+    )
+    # A zip of the order is already pending or running, the order points to its file
+    full_zip_path = Path(job.payload['full_zip_path'])
+    order.extract_result.name = full_zip_path.relative_to(settings.MEDIA_ROOT).as_posix()
+    order.extract_result_size = sum(item.extract_result.size for item in itemFiles)
+
+
+def _parse_range(range_header, size):
+    """
+    Parses a single byte range of a Range header into (start, end) included.
+    Returns None when the header cannot be honoured and the whole file must be sent,
+    (None, None) when the range is not satisfiable.
+    """
+    match = RANGE_RE.match(range_header.replace(' ', ''))
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range, the last N bytes
+        start = max(size - int(end), 0)
+        end = size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return (None, None)
+    return (start, end)
+
+
+def _read_file_range(path, start, length, chunk_size):
+    with open(path, 'rb') as result:
+        result.seek(start)
+        while length > 0:
+            chunk = result.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request, path: Path):
+    """
+    Sends a file without loading it in memory. The file is streamed by chunks
+    of DOWNLOAD_CHUNK_SIZE or handed over to the reverse proxy depending on
+    DOWNLOAD_OFFLOAD_HEADER. Conditional requests (If-None-Match, If-Modified-Since)
+    and single byte ranges are supported.
+    """
+    stat = path.stat()
+    etag = quote_etag('{:x}-{:x}'.format(stat.st_mtime_ns, stat.st_size))
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    (content_type, unused) = mimetypes.guess_type(path)
+    content_type = content_type or 'application/octet-stream'
+    offload_header = settings.DOWNLOAD_OFFLOAD_HEADER
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if range_header and not offload_header and (not if_range or etag in parse_etags(if_range)):
+        byte_range = _parse_range(range_header, stat.st_size)
+
+    if offload_header:
+        response = HttpResponse(content_type=content_type)
+        if offload_header == 'X-Accel-Redirect':
+            relative_path = path.relative_to(settings.MEDIA_ROOT).as_posix()
+            response[offload_header] = settings.DOWNLOAD_OFFLOAD_URL.rstrip('/') + '/' + relative_path
+        else:
+            response[offload_header] = str(path)
+    elif byte_range == (None, None):
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(stat.st_size)
+        return response
+    elif byte_range is not None:
+        (start, end) = byte_range
+        response = StreamingHttpResponse(
+            _read_file_range(path, start, end - start + 1, settings.DOWNLOAD_CHUNK_SIZE),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, stat.st_size)
+    else:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response.block_size = settings.DOWNLOAD_CHUNK_SIZE
+        response['Content-Length'] = stat.st_size
+    response['Content-Disposition'] = f'attachment; filename="{path.name}"'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
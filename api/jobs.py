@@ -0,0 +1,128 @@
+import logging
+import traceback
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+LOGGER = logging.getLogger(__name__)
+
+# Registered job handlers, by job name
+HANDLERS = {}
+
+
+def register(name):
+    """
+    Decorator registering a function as the handler of jobs called `name`.
+    Handlers receive the job payload as keyword arguments and must be idempotent
+    as a job may run more than once (retries, expired leases).
+    """
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+    return decorator
+
+
+def _job_model():
+    # models imports helpers that enqueue jobs, so Job cannot be imported here
+    return apps.get_model('api', 'Job')
+
+
+def enqueue(name, payload=None, dedupe_key=None, run_after=None):
+    """
+    Adds a job to the queue and returns it. If dedupe_key is given and a job
+    with the same key is still pending or running, that job is returned instead.
+    """
+    Job = _job_model()
+    if dedupe_key:
+        existing = Job.objects.filter(
+            dedupe_key=dedupe_key,
+            status__in=[Job.JobStatus.PENDING, Job.JobStatus.RUNNING]
+        ).first()
+        if existing:
+            return existing
+    job = Job(
+        name=name,
+        payload=payload or {},
+        dedupe_key=dedupe_key,
+        run_after=run_after or timezone.now(),
+        max_attempts=settings.JOBS_MAX_ATTEMPTS,
+    )
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        # Another request enqueued the same job in the meantime
+        return Job.objects.get(
+            dedupe_key=dedupe_key,
+            status__in=[Job.JobStatus.PENDING, Job.JobStatus.RUNNING])
+    return job
+
+
+def claim(worker_id):
+    """
+    Takes the next due job for worker_id, or None if there's nothing to do.
+    Rows locked by other workers are skipped, so workers never wait on each other.
+    Running jobs whose lease expired (worker killed) are taken again.
+    """
+    Job = _job_model()
+    now = timezone.now()
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Job.JobStatus.PENDING, run_after__lte=now) |
+            Q(status=Job.JobStatus.RUNNING, locked_until__lt=now)
+        ).order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        job.status = Job.JobStatus.RUNNING
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.locked_until = now + timedelta(seconds=settings.JOBS_LEASE_DURATION)
+        job.save()
+    return job
+
+
+def run(job):
+    """
+    Runs a claimed job and records its outcome. Failed jobs are retried
+    with an exponential delay until max_attempts is reached.
+    """
+    Job = _job_model()
+    handler = HANDLERS.get(job.name)
+    try:
+        if handler is None:
+            raise LookupError('No handler registered for job "{}"'.format(job.name))
+        handler(**job.payload)
+    except Exception:
+        LOGGER.exception('Job %s failed (attempt %s/%s)', job, job.attempts, job.max_attempts)
+        job.last_error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            job.status = Job.JobStatus.FAILED
+            job.date_finished = timezone.now()
+        else:
+            job.status = Job.JobStatus.PENDING
+            job.run_after = timezone.now() + timedelta(
+                seconds=settings.JOBS_RETRY_DELAY * 2 ** (job.attempts - 1))
+    else:
+        job.status = Job.JobStatus.DONE
+        job.date_finished = timezone.now()
+    job.locked_by = ''
+    job.locked_until = None
+    job.save()
+    return job
+
+
+def run_pending(worker_id='inline'):
+    """
+    Runs all due jobs in the current process, returns the number of jobs run
+    """
+    count = 0
+    job = claim(worker_id)
+    while job is not None:
+        run(job)
+        count += 1
+        job = claim(worker_id)
+    return count
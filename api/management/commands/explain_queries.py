@@ -0,0 +1,63 @@
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from api.models import Order, OrderItem, Product
+
+UserModel = get_user_model()
+
+
+class Command(BaseCommand):
+    """
+    Prints the query plans of the hottest order, order item and product queries, to check
+    on a production-sized database which indexes are used, before and after a change.
+    """
+    help = "Prints the query plans of the hot order and product queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--client", help="Username of the client whose orders are queried")
+        parser.add_argument("--provider", help="Username of the provider polling for order items")
+        parser.add_argument(
+            "--term", default="cadastre", help="Text searched by the product autocomplete")
+        parser.add_argument(
+            "--analyze", action="store_true",
+            help="Run the queries to get actual timings (EXPLAIN ANALYZE)")
+
+    def get_user(self, username):
+        if username is None:
+            user = UserModel.objects.order_by("pk").first()
+            if user is None:
+                raise CommandError("No user in database")
+            return user
+        try:
+            return UserModel.objects.get(username=username)
+        except UserModel.DoesNotExist:
+            raise CommandError("User {} does not exist".format(username))
+
+    def get_queries(self, client, provider, term):
+        return {
+            "last_draft": Order.objects.filter(
+                client_id=client.id, order_status=Order.OrderStatus.DRAFT)[:1],
+            "order_history": Order.objects.filter(
+                client_id=client.id).order_by("-date_ordered", "-id")[:100],
+            "extract_poll": OrderItem.objects.filter(
+                Q(order__order_status=Order.OrderStatus.READY) |
+                Q(order__order_status=Order.OrderStatus.PARTIALLY_DELIVERED),
+                Q(status=OrderItem.OrderItemStatus.PENDING) |
+                Q(status=OrderItem.OrderItemStatus.IN_EXTRACT),
+                product__provider=provider,
+            ).order_by("order_id", "id"),
+            "order_download": Order.objects.filter(download_guid=uuid.uuid4()),
+            "item_validation": OrderItem.objects.filter(
+                status=OrderItem.OrderItemStatus.VALIDATION_PENDING, token="token"),
+            # Should use the metadata_name_trgm and product_label_trgm indexes
+            "product_autocomplete": Product.search_similar(term)[:10],
+        }
+
+    def handle(self, *args, **options):
+        client = self.get_user(options["client"])
+        provider = self.get_user(options["provider"])
+        for name, queryset in self.get_queries(client, provider, options["term"]).items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset.explain(analyze=options["analyze"]))
+            self.stdout.write("")
@@ -0,0 +1,70 @@
+import os
+import signal
+import socket
+import threading
+import logging
+from django.conf import settings
+from django.db import connection
+from django.core.management.base import BaseCommand
+from api import jobs
+from api.helpers import flush_email_outbox
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    """
+    Runs a pool of workers processing the job queue (zipping orders, ...)
+    and sending emails of the outbox.
+    Several instances can run side by side, jobs are claimed with SKIP LOCKED.
+    """
+    help = "Processes queued jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pool-size", type=int, default=settings.JOBS_POOL_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=settings.JOBS_POLL_INTERVAL)
+        parser.add_argument(
+            "--once", action="store_true",
+            help="Process all due jobs then exit instead of polling forever")
+
+    def work(self, worker_id, stop, poll_interval, once):
+        try:
+            while not stop.is_set():
+                job = jobs.claim(worker_id)
+                if job is None:
+                    # Nothing else to do, send emails waiting in the outbox
+                    if flush_email_outbox():
+                        continue
+                    if once:
+                        return
+                    stop.wait(poll_interval)
+                    continue
+                jobs.run(job)
+        finally:
+            # Each thread has its own connection
+            connection.close()
+
+    def handle(self, *args, **options):
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            logger.info("Received signal %s, finishing running jobs", signum)
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        prefix = "{}-{}".format(socket.gethostname(), os.getpid())
+        threads = [
+            threading.Thread(
+                target=self.work,
+                name="{}-{}".format(prefix, n),
+                args=("{}-{}".format(prefix, n), stop, options["poll_interval"], options["once"]))
+            for n in range(max(options["pool_size"], 1))
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info("Started %s workers", len(threads))
+        # join with a timeout so the main thread keeps handling signals
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(1)
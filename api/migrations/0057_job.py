@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0056_alter_identity_language_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='name')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='payload')),
+                ('dedupe_key', models.CharField(blank=True, max_length=255, null=True, verbose_name='dedupe_key')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=20, verbose_name='status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('max_attempts', models.PositiveSmallIntegerField(default=5, verbose_name='max_attempts')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='run_after')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='locked_by')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='locked_until')),
+                ('last_error', models.TextField(blank=True, verbose_name='last_error')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='date_created')),
+                ('date_finished', models.DateTimeField(blank=True, null=True, verbose_name='date_finished')),
+            ],
+            options={
+                'verbose_name': 'job',
+                'db_table': 'job',
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['run_after'], name='job_pending_run_after')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status__in', ['PENDING', 'RUNNING'])), fields=('dedupe_key',), name='job_unique_active_dedupe_key')],
+            },
+        ),
+    ]
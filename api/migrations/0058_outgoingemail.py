@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:52
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0057_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutgoingEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='subject')),
+                ('message', models.TextField(blank=True, verbose_name='message')),
+                ('html_message', models.TextField(blank=True, verbose_name='html_message')),
+                ('from_email', models.CharField(max_length=254, verbose_name='from_email')),
+                ('recipient', models.CharField(max_length=254, verbose_name='recipient')),
+                ('dedupe_key', models.CharField(max_length=64, verbose_name='dedupe_key')),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed')], default='PENDING', max_length=20, verbose_name='status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='attempts')),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now, verbose_name='next_attempt')),
+                ('last_error', models.TextField(blank=True, verbose_name='last_error')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='date_created')),
+                ('date_sent', models.DateTimeField(blank=True, null=True, verbose_name='date_sent')),
+            ],
+            options={
+                'verbose_name': 'outgoing_email',
+                'db_table': 'outgoing_email',
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['next_attempt'], name='outgoing_email_pending')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('status', 'PENDING')), fields=('dedupe_key',), name='outgoing_email_unique_pending')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0058_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='extract_lease_expiry',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='extract_lease_expiry'),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='extract_worker',
+            field=models.CharField(blank=True, max_length=100, verbose_name='extract_worker'),
+        ),
+    ]
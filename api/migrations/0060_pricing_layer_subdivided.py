@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:59
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+import pgtrigger.compiler
+import pgtrigger.migrations
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0059_orderitem_extract_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricingGeometrySubdivided',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('geom', django.contrib.gis.db.models.fields.GeometryField(srid=2056, verbose_name='geom')),
+            ],
+            options={
+                'verbose_name': 'pricing_layer_subdivided',
+                'db_table': 'pricing_layer_subdivided',
+            },
+        ),
+        migrations.AddField(
+            model_name='pricinggeometrysubdivided',
+            name='pricing',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to='api.pricing', verbose_name='pricing'),
+        ),
+        migrations.AddField(
+            model_name='pricinggeometrysubdivided',
+            name='pricing_geometry',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to='api.pricinggeometry', verbose_name='pricing_layer'),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='pricinggeometry',
+            trigger=pgtrigger.compiler.Trigger(name='subdivide_pricing_layer_on_change', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n                    IF TG_OP IN ('UPDATE', 'DELETE') THEN\n                        DELETE FROM pricing_layer_subdivided WHERE pricing_geometry_id = OLD.id;\n                    END IF;\n                    IF TG_OP IN ('INSERT', 'UPDATE') THEN\n                        INSERT INTO pricing_layer_subdivided (pricing_geometry_id, pricing_id, geom)\n                        SELECT NEW.id, NEW.pricing_id, ST_Subdivide(NEW.geom, 256);\n                    END IF;\n                    RETURN NULL;\n                ", hash='6d7518f1c5135274d878da76e326239c4b2cfed5', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_subdivide_pricing_layer_on_change_2c2e8', table='pricing_layer', when='AFTER')),
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO pricing_layer_subdivided (pricing_geometry_id, pricing_id, geom)
+                SELECT id, pricing_id, ST_Subdivide(geom, 256) FROM pricing_layer;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
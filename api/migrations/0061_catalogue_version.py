@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:03
+
+import pgtrigger.compiler
+import pgtrigger.migrations
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0060_pricing_layer_subdivided'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(verbose_name='version')),
+                ('date_modified', models.DateTimeField(auto_now=True, verbose_name='date_modified')),
+            ],
+            options={
+                'verbose_name': 'catalogue version',
+                'db_table': 'catalogue_version',
+            },
+        ),
+        migrations.RunSQL(
+            sql=[
+                "CREATE SEQUENCE catalogue_version_seq",
+                "INSERT INTO catalogue_version (id, version, date_modified) "
+                "VALUES (1, nextval('catalogue_version_seq'), now())",
+            ],
+            reverse_sql=["DROP SEQUENCE catalogue_version_seq"],
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='dataformat',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='b63454b37f19ab5f7077fd22d36fa8721d7de614', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_29feb', table='data_format', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='identity',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(condition='WHEN (OLD."company_name" IS DISTINCT FROM (NEW."company_name"))', func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='09334b1408d75381f34d64c672bb59c7872937ad', operation='UPDATE', pgid='pgtrigger_bump_catalogue_version_7ef45', table='identity', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='metadata',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='a1302e65accb94a7c47404e4826613026c40de8a', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_df4a5', table='metadata', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='ordertype',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='d93cd7e858ff2ff0dd99e4b2623f4a57bc2b14df', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_5dc74', table='order_type', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='pricing',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='baaa0073a6ba6d52ce437795e7c5ad626609341e', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_77527', table='pricing', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='product',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='f3dfa8eeeb539776b4953170970a34123696f648', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_932c6', table='product', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='productformat',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='17435a8248137ae1ed9dd14f8f25d431242fc3b9', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_95639', table='product_format', when='AFTER')),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:06
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0061_catalogue_version'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='metadata',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='metadata_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['label'], name='product_label_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
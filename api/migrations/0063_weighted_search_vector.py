@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:07
+
+import pgtrigger.compiler
+import pgtrigger.migrations
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0062_trigram_indexes'),
+    ]
+
+    operations = [
+        pgtrigger.migrations.RemoveTrigger(
+            model_name='metadata',
+            name='update_search_vector_on_change',
+        ),
+        pgtrigger.migrations.RemoveTrigger(
+            model_name='product',
+            name='update_search_vector_on_change',
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='metadata',
+            trigger=pgtrigger.compiler.Trigger(name='update_search_vector_on_change', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n                    IF EXISTS\n                        ( SELECT 1\n                        FROM   information_schema.tables\n                        WHERE  table_schema = CURRENT_SCHEMA()\n                        AND    table_name = 'product'\n                        )\n                    THEN\n                        UPDATE product\n                        SET ts = setweight(to_tsvector('french', COALESCE(label, '')), 'A') || setweight(to_tsvector('french', COALESCE(NEW.description_long, '')), 'B') || setweight(to_tsvector('german', COALESCE(label, '')), 'A') || setweight(to_tsvector('german', COALESCE(NEW.description_long, '')), 'B') || setweight(to_tsvector('italian', COALESCE(label, '')), 'A') || setweight(to_tsvector('italian', COALESCE(NEW.description_long, '')), 'B')\n                        WHERE metadata_id = NEW.id;\n                    END IF ;\n                    RETURN NEW;\n                ", hash='af174bded661a1033ce50da0fec99839fb4f2f97', operation='UPDATE', pgid='pgtrigger_update_search_vector_on_change_86c20', table='metadata', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='product',
+            trigger=pgtrigger.compiler.Trigger(name='update_search_vector_on_change', sql=pgtrigger.compiler.UpsertTriggerSql(declare='DECLARE description TEXT;', func="\n                    SELECT description_long INTO description FROM metadata WHERE id = NEW.metadata_id;\n                    NEW.ts := setweight(to_tsvector('french', COALESCE(NEW.label, '')), 'A') || setweight(to_tsvector('french', COALESCE(description, '')), 'B') || setweight(to_tsvector('german', COALESCE(NEW.label, '')), 'A') || setweight(to_tsvector('german', COALESCE(description, '')), 'B') || setweight(to_tsvector('italian', COALESCE(NEW.label, '')), 'A') || setweight(to_tsvector('italian', COALESCE(description, '')), 'B');\n                    RETURN NEW;\n                ", hash='0a60f67def2c9ef6bb7c00c799e736cdeb7290e3', operation='UPDATE OR INSERT', pgid='pgtrigger_update_search_vector_on_change_86bf9', table='product', when='BEFORE')),
+        ),
+        # The product trigger computes the weighted vectors of existing products
+        migrations.RunSQL(
+            sql="UPDATE product SET ts = NULL",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes of large tables are built without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('api', '0064_pagination_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('order_status', 'DRAFT')), fields=['client', '-date_ordered'], name='order_client_draft'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('download_guid__isnull', False)), fields=['download_guid'], name='order_download_guid'),
+        ),
+        AddIndexConcurrently(
+            model_name='orderitem',
+            index=models.Index(condition=models.Q(('status__in', ['PENDING', 'IN_EXTRACT'])), fields=['product', 'order', 'id'], name='order_item_extract_poll'),
+        ),
+        AddIndexConcurrently(
+            model_name='orderitem',
+            index=models.Index(condition=models.Q(('status', 'VALIDATION_PENDING')), fields=['token'], name='order_item_validation_token'),
+        ),
+    ]
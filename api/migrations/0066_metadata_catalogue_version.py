@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:24
+
+import pgtrigger.compiler
+import pgtrigger.migrations
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0065_hot_query_indexes'),
+    ]
+
+    operations = [
+        pgtrigger.migrations.RemoveTrigger(
+            model_name='identity',
+            name='bump_catalogue_version',
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='copyright',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='bc95e61171fb14f3250731fb5b24bcd8fddf1bf9', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_04ef6', table='copyright', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='document',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='bbf2604f034d81f22340dd2572ac996698c5b780', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_11656', table='document', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='identity',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(condition='WHEN (OLD."city" IS DISTINCT FROM (NEW."city") OR OLD."company_name" IS DISTINCT FROM (NEW."company_name") OR OLD."country" IS DISTINCT FROM (NEW."country") OR OLD."email" IS DISTINCT FROM (NEW."email") OR OLD."first_name" IS DISTINCT FROM (NEW."first_name") OR OLD."last_name" IS DISTINCT FROM (NEW."last_name") OR OLD."phone" IS DISTINCT FROM (NEW."phone") OR OLD."postcode" IS DISTINCT FROM (NEW."postcode") OR OLD."street" IS DISTINCT FROM (NEW."street") OR OLD."street2" IS DISTINCT FROM (NEW."street2"))', func="\n                    IF OLD.company_name IS DISTINCT FROM NEW.company_name\n                        OR EXISTS (SELECT 1 FROM metadata_contact_persons WHERE contact_person_id = NEW.id)\n                    THEN\n                        UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n                    END IF;\n                    RETURN NULL;\n                ", hash='b8d1c344aae96f252c5734167cf1b3da223c5e3c', operation='UPDATE', pgid='pgtrigger_bump_catalogue_version_7ef45', table='identity', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='metadatacategoryech',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='143fe938f5a232050268f412da3bf4189b86c22e', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_406ad', table='metadata_category_ech', when='AFTER')),
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='metadatacontact',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(func="\n    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n    RETURN NULL;\n", hash='6685aadde2e8bb87f227ca73d5d4d64f88c3f87e', level='STATEMENT', operation='INSERT OR UPDATE OR DELETE', pgid='pgtrigger_bump_catalogue_version_20a7a', table='metadata_contact_persons', when='AFTER')),
+        ),
+        # The documents of metadata are linked by an automatic many-to-many table,
+        # on which pgtrigger can't declare triggers
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE FUNCTION metadata_documents_bump_catalogue_version() RETURNS TRIGGER AS $$
+                BEGIN
+                    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();
+                    RETURN NULL;
+                END;
+                $$ LANGUAGE plpgsql
+                """,
+                """
+                CREATE TRIGGER metadata_documents_bump_catalogue_version
+                AFTER INSERT OR UPDATE OR DELETE ON metadata_documents
+                FOR EACH STATEMENT EXECUTE FUNCTION metadata_documents_bump_catalogue_version()
+                """,
+            ],
+            reverse_sql=[
+                "DROP TRIGGER metadata_documents_bump_catalogue_version ON metadata_documents",
+                "DROP FUNCTION metadata_documents_bump_catalogue_version()",
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:33
+
+import pgtrigger.compiler
+import pgtrigger.migrations
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0066_metadata_catalogue_version'),
+    ]
+
+    operations = [
+        pgtrigger.migrations.RemoveTrigger(
+            model_name='identity',
+            name='bump_catalogue_version',
+        ),
+        pgtrigger.migrations.AddTrigger(
+            model_name='identity',
+            trigger=pgtrigger.compiler.Trigger(name='bump_catalogue_version', sql=pgtrigger.compiler.UpsertTriggerSql(condition='WHEN (OLD."city" IS DISTINCT FROM (NEW."city") OR OLD."company_name" IS DISTINCT FROM (NEW."company_name") OR OLD."country" IS DISTINCT FROM (NEW."country") OR OLD."email" IS DISTINCT FROM (NEW."email") OR OLD."first_name" IS DISTINCT FROM (NEW."first_name") OR OLD."last_name" IS DISTINCT FROM (NEW."last_name") OR OLD."phone" IS DISTINCT FROM (NEW."phone") OR OLD."postcode" IS DISTINCT FROM (NEW."postcode") OR OLD."street" IS DISTINCT FROM (NEW."street") OR OLD."street2" IS DISTINCT FROM (NEW."street2"))', func="\n                    IF (OLD.company_name IS DISTINCT FROM NEW.company_name\n                            AND EXISTS (SELECT 1 FROM product WHERE provider_id = NEW.user_id))\n                        OR EXISTS (SELECT 1 FROM metadata_contact_persons WHERE contact_person_id = NEW.id)\n                    THEN\n                        UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();\n                    END IF;\n                    RETURN NULL;\n                ", hash='04404640d0851d645c840634ce653ea225067b4c', operation='UPDATE', pgid='pgtrigger_bump_catalogue_version_7ef45', table='identity', when='AFTER')),
+        ),
+    ]
@@ -2,12 +2,17 @@ import logging
 import secrets
 import uuid
 from django.conf import settings
+from django.core.mail import EmailMultiAlternatives
 from django.core.validators import RegexValidator
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import MultiPolygon, Polygon
+from django.db import connection
+from django.db.models import Exists, OuterRef, Prefetch, Q, prefetch_related_objects
+from django.db.models.functions import Greatest
+from django.db.models.lookups import IContains
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon, Polygon
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
-from django.contrib.postgres.search import SearchVectorField
+from django.contrib.postgres.search import SearchVectorField, TrigramWordSimilarity
 from django.contrib.postgres.indexes import GinIndex, BTreeIndex
 from django.utils import timezone
 from django.utils.html import mark_safe
@@ -18,6 +23,7 @@ from djmoney.models.fields import MoneyField
 
 import pgtrigger
 
+from . import catalogue
 from .pricing import ProductPriceCalculator
 from .helpers import RandomFileName, send_geoshop_email
 
@@ -25,6 +31,118 @@ LOGGER = logging.getLogger(__name__)
 # Get the UserModel
 UserModel = get_user_model()
 
+# Orders for public authorities or academic purposes, whose items are free
+FREE_ORDER_TYPES = ("Communal", "Cantonal", "Fédéral", "Académique")
+
+# Maximum number of vertices of the parts of pricing layer geometries
+PRICING_LAYER_SUBDIVIDE_VERTICES = 256
+
+# Every statement modifying a catalogue table gives the catalogue a new version, telling
+# processes to reload the catalogue they keep in memory (see catalogue.py). Versions come
+# from a sequence so the version of a rolled back change is never given again.
+CATALOGUE_VERSION_BUMP_SQL = """
+    UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();
+    RETURN NULL;
+"""
+
+
+# Identity fields shown with the contacts of metadata (see MetadataIdentitySerializer)
+METADATA_CONTACT_IDENTITY_FIELDS = (
+    "first_name", "last_name", "email", "phone", "street", "street2",
+    "company_name", "postcode", "city", "country",
+)
+
+
+def catalogue_version_trigger(**kwargs):
+    """
+    Trigger bumping the catalogue version after each statement changing the table
+    """
+    options = {
+        "level": pgtrigger.Statement,
+        "operation": pgtrigger.Insert | pgtrigger.Update | pgtrigger.Delete,
+        "func": CATALOGUE_VERSION_BUMP_SQL,
+    }
+    options.update(kwargs)
+    return pgtrigger.Trigger(
+        name="bump_catalogue_version",
+        when=pgtrigger.After,
+        **options
+    )
+
+
+@models.CharField.register_lookup
+class ILikeContains(IContains):
+    """
+    Case insensitive containment written `column ILIKE '%value%'`. Unlike icontains,
+    which compares UPPER(column), trigram (gin_trgm_ops) indexes can serve it.
+    """
+    lookup_name = "ilike"
+
+    def as_sql(self, compiler, connection):
+        lhs_sql, lhs_params = self.process_lhs(compiler, connection)
+        rhs_sql, rhs_params = self.process_rhs(compiler, connection)
+        return "%s ILIKE %s" % (lhs_sql, rhs_sql), (*lhs_params, *rhs_params)
+
+
+def product_search_vector_sql(label, description):
+    """
+    SQL of the full text search vector of a product in each search language,
+    its label weighted A and the description of its metadata weighted B
+    """
+    return " || ".join(
+        f"setweight(to_tsvector('{config}', COALESCE({label}, '')), 'A') || "
+        f"setweight(to_tsvector('{config}', COALESCE({description}, '')), 'B')"
+        for config in ("french", "german", "italian")
+    )
+
+
+# Products inside groups, at any depth, that are not groups themselves.
+# path keeps the order of products in the catalogue, ids protects from cycles
+LEAF_PRODUCTS_SQL = """
+    WITH RECURSIVE tree (root_id, id, ids, path) AS (
+        SELECT group_id, id, ARRAY[id], ARRAY[COALESCE("order", 9223372036854775807), id]
+        FROM product
+        WHERE group_id = ANY(%s)
+      UNION ALL
+        SELECT tree.root_id, child.id, tree.ids || child.id,
+            tree.path || ARRAY[COALESCE(child."order", 9223372036854775807), child.id]
+        FROM product child
+        JOIN tree ON child.group_id = tree.id
+        WHERE child.id <> ALL(tree.ids)
+    )
+    SELECT product.*, tree.root_id
+    FROM tree
+    JOIN product ON product.id = tree.id
+    WHERE NOT EXISTS (SELECT 1 FROM product child WHERE child.group_id = product.id)
+    {geom_filter}
+    ORDER BY tree.root_id, tree.path
+"""
+
+# Areas of an order geom not owned by the user for each product, and for the whole order
+OWNERSHIP_EXCLUSION_SQL = """
+    WITH requested AS (
+        SELECT ST_GeomFromEWKT(%(geom)s) AS geom
+    ),
+    owned AS (
+        SELECT ownership.product_id, ST_Union(ownership.geom) AS geom
+        FROM {ownership_table} ownership
+        JOIN {user_groups_table} user_groups ON user_groups.group_id = ownership.user_group_id
+        WHERE ownership.product_id = ANY(%(products)s) AND user_groups.user_id = %(user)s
+        GROUP BY ownership.product_id
+    )
+    SELECT owned.product_id,
+        ST_Area(ST_Difference(requested.geom, owned.geom)),
+        ST_Area(owned.geom),
+        NULL
+    FROM owned, requested
+    UNION ALL
+    SELECT NULL, NULL, NULL, ST_AsEWKB(COALESCE(
+        ST_Difference(requested.geom, (SELECT ST_Union(geom) FROM owned)),
+        requested.geom
+    ))
+    FROM requested
+"""
+
 
 class AbstractIdentity(models.Model):
     """
@@ -67,6 +185,7 @@ class Contact(AbstractIdentity):
     class Meta:
         db_table = "contact"
         verbose_name = _("contact")
+        indexes = [models.Index(fields=["belongs_to", "id"], name="contact_belongs_to_id")]
 
 
 class Copyright(models.Model):
@@ -75,6 +194,7 @@ class Copyright(models.Model):
     class Meta:
         db_table = "copyright"
         verbose_name = _("copyright")
+        triggers = [catalogue_version_trigger()]
 
     def __str__(self):
         return self.description
@@ -93,6 +213,7 @@ class Document(models.Model):
     class Meta:
         db_table = "document"
         verbose_name = _("document")
+        triggers = [catalogue_version_trigger()]
 
     def __str__(self):
         return "%s (%s)" % (self.name, self.link.split("/")[-1])
@@ -104,6 +225,7 @@ class DataFormat(models.Model):
     class Meta:
         db_table = "data_format"
         verbose_name = _("data_format")
+        triggers = [catalogue_version_trigger()]
 
     def __str__(self):
         return self.name
@@ -116,11 +238,28 @@ class OrderType(models.Model):
         db_table = "order_type"
         verbose_name = _("order type")
         verbose_name_plural = _("order types")
+        triggers = [catalogue_version_trigger()]
 
     def __str__(self):
         return self.name
 
 
+class CatalogueVersion(models.Model):
+    """
+    Single row holding the version of the catalogue, changed by triggers each time
+    products, pricings, formats, order types or metadata are modified.
+    """
+    version = models.BigIntegerField(_("version"))
+    date_modified = models.DateTimeField(_("date_modified"), auto_now=True)
+
+    class Meta:
+        db_table = "catalogue_version"
+        verbose_name = _("catalogue version")
+
+    def __str__(self):
+        return str(self.version)
+
+
 class Identity(AbstractIdentity):
     """
     All users have an Identity but not all identities are users.
@@ -167,6 +306,135 @@ class Identity(AbstractIdentity):
     class Meta:
         db_table = "identity"
         verbose_name = _("identity")
+        triggers = [
+            # Company names of product providers are shown with the products,
+            # identities of metadata contacts with the metadata. Other identities
+            # (clients) don't touch the catalogue version.
+            catalogue_version_trigger(
+                level=pgtrigger.Row,
+                operation=pgtrigger.Update,
+                condition=pgtrigger.AnyChange(*METADATA_CONTACT_IDENTITY_FIELDS),
+                func="""
+                    IF (OLD.company_name IS DISTINCT FROM NEW.company_name
+                            AND EXISTS (SELECT 1 FROM product WHERE provider_id = NEW.user_id))
+                        OR EXISTS (SELECT 1 FROM metadata_contact_persons WHERE contact_person_id = NEW.id)
+                    THEN
+                        UPDATE catalogue_version SET version = nextval('catalogue_version_seq'), date_modified = now();
+                    END IF;
+                    RETURN NULL;
+                """,
+            ),
+        ]
+
+
+class Job(models.Model):
+    """
+    Slow side effects (zipping, emails...) run in background by `manage.py run_workers`.
+    Jobs are retried with a growing delay until max_attempts is reached.
+    """
+
+    class JobStatus(models.TextChoices):
+        PENDING = "PENDING", _("Pending")
+        RUNNING = "RUNNING", _("Running")
+        DONE = "DONE", _("Done")
+        FAILED = "FAILED", _("Failed")
+
+    name = models.CharField(_("name"), max_length=100)
+    payload = models.JSONField(_("payload"), default=dict, blank=True)
+    dedupe_key = models.CharField(_("dedupe_key"), max_length=255, null=True, blank=True)
+    status = models.CharField(
+        _("status"),
+        max_length=20,
+        choices=JobStatus.choices,
+        default=JobStatus.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0)
+    max_attempts = models.PositiveSmallIntegerField(_("max_attempts"), default=5)
+    run_after = models.DateTimeField(_("run_after"), default=timezone.now)
+    locked_by = models.CharField(_("locked_by"), max_length=100, blank=True)
+    locked_until = models.DateTimeField(_("locked_until"), null=True, blank=True)
+    last_error = models.TextField(_("last_error"), blank=True)
+    date_created = models.DateTimeField(_("date_created"), auto_now_add=True)
+    date_finished = models.DateTimeField(_("date_finished"), null=True, blank=True)
+
+    class Meta:
+        db_table = "job"
+        verbose_name = _("job")
+        indexes = [
+            models.Index(
+                fields=["run_after"],
+                name="job_pending_run_after",
+                condition=models.Q(status="PENDING"),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                name="job_unique_active_dedupe_key",
+                condition=models.Q(status__in=["PENDING", "RUNNING"]),
+            ),
+        ]
+
+    def __str__(self):
+        return "%s #%s (%s)" % (self.name, self.id, self.status)
+
+
+class OutgoingEmail(models.Model):
+    """
+    Outbox of emails sent by `manage.py run_workers` when EMAIL_OUTBOX_ENABLED is set.
+    There's one row per recipient.
+    """
+
+    class OutgoingEmailStatus(models.TextChoices):
+        PENDING = "PENDING", _("Pending")
+        SENT = "SENT", _("Sent")
+        FAILED = "FAILED", _("Failed")
+
+    subject = models.CharField(_("subject"), max_length=255)
+    message = models.TextField(_("message"), blank=True)
+    html_message = models.TextField(_("html_message"), blank=True)
+    from_email = models.CharField(_("from_email"), max_length=254)
+    recipient = models.CharField(_("recipient"), max_length=254)
+    dedupe_key = models.CharField(_("dedupe_key"), max_length=64)
+    status = models.CharField(
+        _("status"),
+        max_length=20,
+        choices=OutgoingEmailStatus.choices,
+        default=OutgoingEmailStatus.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0)
+    next_attempt = models.DateTimeField(_("next_attempt"), default=timezone.now)
+    last_error = models.TextField(_("last_error"), blank=True)
+    date_created = models.DateTimeField(_("date_created"), auto_now_add=True)
+    date_sent = models.DateTimeField(_("date_sent"), null=True, blank=True)
+
+    class Meta:
+        db_table = "outgoing_email"
+        verbose_name = _("outgoing_email")
+        indexes = [
+            models.Index(
+                fields=["next_attempt"],
+                name="outgoing_email_pending",
+                condition=models.Q(status="PENDING"),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                name="outgoing_email_unique_pending",
+                condition=models.Q(status="PENDING"),
+            ),
+        ]
+
+    def __str__(self):
+        return "%s - %s" % (self.recipient, self.subject)
+
+    def to_message(self, connection=None):
+        email = EmailMultiAlternatives(
+            self.subject, self.message, self.from_email, [self.recipient], connection=connection)
+        if self.html_message:
+            email.attach_alternative(self.html_message, "text/html")
+        return email
 
 
 class MetadataCategoryEch(models.Model):
@@ -180,6 +448,7 @@ class MetadataCategoryEch(models.Model):
     class Meta:
         db_table = "metadata_category_ech"
         verbose_name = _("metadata_category_ech")
+        triggers = [catalogue_version_trigger()]
 
     def __str__(self):
         return "%s (%s)" % (self.description_fr, self.notation)
@@ -230,6 +499,7 @@ class Metadata(models.Model):
     copyright = models.ForeignKey(
         Copyright, models.SET_NULL, verbose_name=_("copyright"), blank=True, null=True
     )
+    # Changes to the links also bump the catalogue version (trigger in migration 0066)
     documents = models.ManyToManyField(
         Document, verbose_name=_("documents"), blank=True
     )
@@ -256,6 +526,7 @@ class Metadata(models.Model):
     class Meta:
         db_table = "metadata"
         verbose_name = _("metadata")
+        indexes = [GinIndex(fields=["name"], name="metadata_name_trgm", opclasses=["gin_trgm_ops"])]
         permissions = [
             (
                 "view_internal",
@@ -267,7 +538,7 @@ class Metadata(models.Model):
                 name="update_search_vector_on_change",
                 operation=pgtrigger.Update,
                 when=pgtrigger.After,
-                func="""
+                func=f"""
                     IF EXISTS
                         ( SELECT 1
                         FROM   information_schema.tables
@@ -276,14 +547,13 @@ class Metadata(models.Model):
                         )
                     THEN
                         UPDATE product
-                        SET ts = to_tsvector('french', label || ' ' || NEW.description_long) ||
-                                to_tsvector('german', label || ' ' || NEW.description_long) ||
-                                to_tsvector('italian', label || ' ' || NEW.description_long)
+                        SET ts = {product_search_vector_sql("label", "NEW.description_long")}
                         WHERE metadata_id = NEW.id;
                     END IF ;
                     RETURN NEW;
                 """,
             ),
+            catalogue_version_trigger(),
         ]
 
     def __str__(self):
@@ -336,6 +606,7 @@ class MetadataContact(models.Model):
     class Meta:
         db_table = "metadata_contact_persons"
         verbose_name = _("metadata_contact")
+        triggers = [catalogue_version_trigger()]
 
     def __str__(self):
         return "%s - %s (%s)" % (self.contact_person, self.metadata, self.metadata_role)
@@ -402,13 +673,33 @@ class Pricing(models.Model):
     class Meta:
         db_table = "pricing"
         verbose_name = _("pricing")
+        triggers = [catalogue_version_trigger()]
 
     def get_price(self, polygon):
         """
         Returns the price of a product given a polygon
         """
         price = ProductPriceCalculator.get_price(pricing_instance=self, polygon=polygon)
+        return self._bound_price(price)
 
+    @classmethod
+    def get_prices(cls, polygon, pricings):
+        """
+        Returns the prices of many pricings given a polygon, as a dict of
+        (price, base_fee) keyed by pricing id. Pricing layers are queried once
+        for all pricings.
+        """
+        pricings = {pricing.id: pricing for pricing in pricings}
+        prices = ProductPriceCalculator.get_prices(polygon, pricings.values())
+        return {
+            pricing_id: pricing._bound_price(prices[pricing_id])
+            for pricing_id, pricing in pricings.items()
+        }
+
+    def _bound_price(self, price):
+        """
+        Applies min_price and max_price to a calculated price
+        """
         if price is None:
             return None, None
 
@@ -447,11 +738,48 @@ class PricingGeometry(models.Model):
         db_table = "pricing_layer"
         verbose_name = _("pricing_layer")
         indexes = (BTreeIndex(fields=("name",)),)
+        triggers = [
+            pgtrigger.Trigger(
+                name="subdivide_pricing_layer_on_change",
+                operation=(pgtrigger.Insert | pgtrigger.Update | pgtrigger.Delete),
+                when=pgtrigger.After,
+                func=f"""
+                    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                        DELETE FROM pricing_layer_subdivided WHERE pricing_geometry_id = OLD.id;
+                    END IF;
+                    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                        INSERT INTO pricing_layer_subdivided (pricing_geometry_id, pricing_id, geom)
+                        SELECT NEW.id, NEW.pricing_id, ST_Subdivide(NEW.geom, {PRICING_LAYER_SUBDIVIDE_VERTICES});
+                    END IF;
+                    RETURN NULL;
+                """,
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class PricingGeometrySubdivided(models.Model):
+    """
+    Pricing layer geometries cut in small parts by ST_Subdivide, maintained by a trigger
+    on PricingGeometry. Intersections of an order with large pricing areas are computed
+    on the parts hit by the order instead of on the whole areas.
+    """
+
+    pricing_geometry = models.ForeignKey(
+        PricingGeometry, models.DO_NOTHING, db_constraint=False, verbose_name=_("pricing_layer")
+    )
+    pricing = models.ForeignKey(
+        Pricing, models.DO_NOTHING, db_constraint=False, verbose_name=_("pricing"), null=True
+    )
+    geom = models.GeometryField(_("geom"), srid=settings.DEFAULT_SRID)
+
+    class Meta:
+        db_table = "pricing_layer_subdivided"
+        verbose_name = _("pricing_layer_subdivided")
+
+
 class Product(models.Model):
     """
     A product is mostly a table or a raster. It can also be a group of products.
@@ -534,21 +862,24 @@ class Product(models.Model):
         verbose_name = _("product")
         ordering = ["order"]
         # https://www.postgresql.org/docs/10/gin-intro.html
-        indexes = [GinIndex(fields=["ts"])]
+        indexes = [
+            GinIndex(fields=["ts"]),
+            # Autocomplete on labels, see ProductViewSet.autocomplete
+            GinIndex(fields=["label"], name="product_label_trgm", opclasses=["gin_trgm_ops"]),
+        ]
         triggers = [
             pgtrigger.Trigger(
                 name="update_search_vector_on_change",
                 operation=(pgtrigger.Update | pgtrigger.Insert),
                 when=pgtrigger.Before,
                 declare=[("description", "TEXT")],
-                func="""
+                func=f"""
                     SELECT description_long INTO description FROM metadata WHERE id = NEW.metadata_id;
-                    NEW.ts := to_tsvector('french', NEW.label || ' ' || description) ||
-                            to_tsvector('german', NEW.label || ' ' || description) ||
-                            to_tsvector('italian', NEW.label || ' ' || description);
+                    NEW.ts := {product_search_vector_sql("NEW.label", "description")};
                     RETURN NEW;
                 """,
             ),
+            catalogue_version_trigger(),
         ]
 
     def __str__(self):
@@ -565,6 +896,52 @@ class Product(models.Model):
 
     thumbnail_tag.short_description = _("thumbnail")
 
+    @classmethod
+    def search_similar(cls, term):
+        """
+        Published products whose label or metadata name contains term or looks like it
+        (typos), annotated with their similarity to term, the most similar first.
+        All conditions can be answered by the trigram indexes.
+        """
+        return cls.objects.filter(
+            Q(label__ilike=term) | Q(label__trigram_word_similar=term)
+            | Q(metadata__name__ilike=term) | Q(metadata__name__trigram_word_similar=term),
+            product_status=cls.ProductStatus.PUBLISHED,
+        ).select_related("metadata").annotate(
+            similarity=Greatest(
+                TrigramWordSimilarity(term, "label"),
+                TrigramWordSimilarity(term, "metadata__name"),
+            )
+        ).order_by("-similarity", "label")
+
+    @classmethod
+    def get_leaf_products(cls, groups, geom=None):
+        """
+        Returns a dict with, for each group in groups, the products found at any depth
+        inside the group that are not groups themselves, in catalogue order.
+        If geom is given, only products intersecting geom are returned.
+        The whole tree is walked by a single recursive query, pricing and
+        formats of the products are fetched along.
+        """
+        leaf_products = {group.id: [] for group in groups}
+        if not leaf_products:
+            return leaf_products
+        params = [list(leaf_products)]
+        geom_filter = ""
+        if geom is not None:
+            geom_filter = "AND ST_Intersects(product.geom, ST_GeomFromEWKT(%s))"
+            params.append(geom.ewkt)
+        products = list(cls.objects.raw(LEAF_PRODUCTS_SQL.format(geom_filter=geom_filter), params))
+        # Formats in pk order, the first one is the default format of the product
+        prefetch_related_objects(products, "pricing", Prefetch(
+            "product_formats",
+            queryset=ProductFormat.objects.order_by("pk").select_related("data_format"),
+        ))
+        for product in products:
+            leaf_products[product.root_id].append(product)
+        return leaf_products
+
+
 class ProductOwnership(models.Model):
     user_group = models.ForeignKey(
         Group, models.CASCADE, verbose_name=_("user_group")
@@ -580,6 +957,61 @@ class ProductOwnership(models.Model):
     def __str__(self):
         return f'Product ownership for "{self.user_group}" in "{self.product}"'
 
+    @classmethod
+    def get_excluded_areas(cls, geom, products, user):
+        """
+        Compares geom to the areas owned by the groups of user for each product.
+        Returns a dict {product_id: (excluded_area, owned_area)}, excluded_area being
+        the area of geom outside the product owned area, and the part of geom
+        outside the owned areas of all products.
+        Everything is computed by PostGIS in a single query.
+        """
+        product_ids = list({product.id for product in products})
+        if not product_ids:
+            return {}, geom
+        if not getattr(connection.ops, "postgis", False):
+            return cls._get_excluded_areas_python(geom, product_ids, user)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                OWNERSHIP_EXCLUSION_SQL.format(
+                    ownership_table=connection.ops.quote_name(cls._meta.db_table),
+                    user_groups_table=connection.ops.quote_name(
+                        UserModel.groups.through._meta.db_table),
+                ),
+                {"geom": geom.ewkt, "products": product_ids, "user": user.id},
+            )
+            rows = cursor.fetchall()
+        excluded_areas = {product_id: (geom.area, 0) for product_id in product_ids}
+        excluded_geom = geom
+        for product_id, excluded_area, owned_area, excluded_ewkb in rows:
+            if product_id is None:
+                excluded_geom = GEOSGeometry(excluded_ewkb)
+            else:
+                excluded_areas[product_id] = (excluded_area, owned_area)
+        return excluded_areas, excluded_geom
+
+    @classmethod
+    def _get_excluded_areas_python(cls, geom, product_ids, user):
+        """
+        Same as get_excluded_areas, computed with GEOS when database has no PostGIS
+        """
+        owned_by_product = {}
+        for ownership in cls.objects.filter(
+            product_id__in=product_ids, user_group__user=user
+        ):
+            if ownership.product_id in owned_by_product:
+                owned_by_product[ownership.product_id] = owned_by_product[
+                    ownership.product_id].union(ownership.geom)
+            else:
+                owned_by_product[ownership.product_id] = ownership.geom
+        excluded_areas = {}
+        excluded_geom = geom
+        for product_id in product_ids:
+            owned_area = owned_by_product.get(product_id, MultiPolygon(srid=settings.DEFAULT_SRID))
+            excluded_areas[product_id] = (geom.difference(owned_area).area, owned_area.area)
+            excluded_geom = excluded_geom.difference(owned_area)
+        return excluded_areas, excluded_geom
+
 class Order(models.Model):
     """
     processing_fee should default to the maximum of base fees in the order but can then be edited mannually
@@ -681,6 +1113,22 @@ class Order(models.Model):
         db_table = "order"
         ordering = ["-date_ordered"]
         verbose_name = _("order")
+        indexes = [
+            # Order history of a client, paginated with a cursor
+            models.Index(fields=["client", "-date_ordered", "-id"], name="order_client_date_ordered"),
+            # Last draft of a client
+            models.Index(
+                fields=["client", "-date_ordered"],
+                name="order_client_draft",
+                condition=models.Q(order_status="DRAFT"),
+            ),
+            # Downloads of a whole order
+            models.Index(
+                fields=["download_guid"],
+                name="order_download_guid",
+                condition=models.Q(download_guid__isnull=False),
+            ),
+        ]
 
     def _reset_prices(self):
         self.processing_fee = None
@@ -743,47 +1191,89 @@ class Order(models.Model):
             )
         return price_is_set
 
-    def _flatten_groups(self, group_of_products: Product, data_format: DataFormat):
+    def set_items_price(self, items):
+        """
+        Sets the price of many items of this order at once and saves them.
+        Prices of all pricings involved are computed together by Pricing.get_prices.
         """
-        Creates an OrderItem for each child found in an incoming group_of_products.
+        for item in items:
+            item.use_catalogue()
+        # Only the pricings set_price will use are computed: computing the others
+        # (groups, manual or free orders) could send pricing error emails for nothing
+        priced_items = [item for item in items if not item.is_priced_by_order_type()]
+        leaf_products = Product.get_leaf_products(
+            [
+                item.product for item in priced_items
+                if item.product.pricing.pricing_type == Pricing.PricingType.FROM_CHILDREN_OF_GROUP
+            ],
+            self.geom,
+        )
+        pricings = {
+            item.product.pricing_id: item.product.pricing for item in priced_items
+            if item.product.pricing.pricing_type not in (
+                Pricing.PricingType.MANUAL, Pricing.PricingType.FROM_CHILDREN_OF_GROUP)
+        }
+        for products in leaf_products.values():
+            pricings.update({product.pricing_id: product.pricing for product in products})
+        prices = Pricing.get_prices(self.geom, pricings.values())
+        for item in items:
+            item.set_price(prices=prices, leaf_products=leaf_products.get(item.product_id))
+            item.save()
+
+    def _flatten_groups(self, group_of_products: Product, data_format: DataFormat, leaf_products=None):
+        """
+        Returns a new OrderItem for each product found at any depth in an incoming
+        group_of_products and intersecting current order geom.
+        leaf_products may hold the products of the group found beforehand by
+        Product.get_leaf_products.
         The new OrderItems will inherit chosen data_format for the group if possible.
         """
-        for child_product in group_of_products.products.all():
-            # if child_product is a group, recurse
-            if child_product.products.exists():
-                self._flatten_groups(child_product, data_format)
-                continue
-
-            # only create OrderItem for products that intersect current order geom
-            if child_product.geom.intersects(self.geom):
-                new_item = OrderItem(
-                    order=self, product=child_product, data_format=data_format
+        if leaf_products is None:
+            leaf_products = Product.get_leaf_products(
+                [group_of_products], self.geom)[group_of_products.id]
+        new_items = []
+        for child_product in leaf_products:
+            new_item = OrderItem(
+                order=self, product=child_product, data_format=data_format
+            )
+            product_formats = list(child_product.product_formats.all())
+            available_formats = [
+                product_format.data_format.name for product_format in product_formats
+            ]
+            # If the data format for the group is not available for the item,
+            # pick the first possible
+            LOGGER.debug(f"{child_product.label} wants format: {data_format}")
+            if data_format is None or data_format.name not in available_formats:
+                LOGGER.warning(
+                    f"{data_format} is not in {available_formats}"
                 )
-                # If the data format for the group is not available for the item,
-                # pick the first possible
-                LOGGER.debug(f"{child_product.label} wants format: {data_format}")
-                if new_item.data_format.name not in new_item.available_formats:
-                    LOGGER.warning(
-                        f"{new_item.data_format} is not in {new_item.available_formats}"
-                    )
-                    new_item.data_format = (
-                        child_product.product_formats.all().first().data_format
-                    )
-                new_item.set_price()
-                new_item.save()
+                new_item.data_format = (
+                    product_formats[0].data_format if product_formats else None
+                )
+            new_items.append(new_item)
+        return new_items
 
     def _expand_product_groups(self):
         """
         When an OrderItem is a group of products, the OrderItem is deleted from cart and
         is replaced with one OrderItem for each product inside the group by calling
-        _flatten_groups.
+        _flatten_groups. New OrderItems are priced all together.
         """
-        items = self.items.all()
+        items = list(self.items.select_related("product", "data_format").annotate(
+            is_group=Exists(Product.objects.filter(group_id=OuterRef("product_id")))
+        ))
+        leaf_products = Product.get_leaf_products(
+            [item.product for item in items if item.is_group], self.geom
+        )
+        new_items = []
         for item in items:
             # if ordered product is a group (if product has children)
-            if item.product.products.exists():
-                self._flatten_groups(item.product, item.data_format)
+            if item.is_group:
+                new_items += self._flatten_groups(
+                    item.product, item.data_format, leaf_products[item.product_id]
+                )
                 item.delete()
+        self.set_items_price(new_items)
 
     def confirm(self):
         """Customer's confirmations he wants to proceed with the order"""
@@ -934,6 +1424,9 @@ class OrderItem(models.Model):
         upload_to=RandomFileName("extract"), null=True, blank=True
     )
     extract_result_size = models.BigIntegerField(_("extract_result_size"), null=True, blank=True)
+    # Extract instance processing the item, until the lease expires
+    extract_worker = models.CharField(_("extract_worker"), max_length=100, blank=True)
+    extract_lease_expiry = models.DateTimeField(_("extract_lease_expiry"), null=True, blank=True)
     comment = models.TextField(_("comment"), null=True, blank=True)
     token = models.CharField(_("token"), max_length=256, null=True, blank=True)
     download_guid = models.UUIDField(_("download_guid"), null=True, blank=True, unique=True)
@@ -941,13 +1434,40 @@ class OrderItem(models.Model):
     class Meta:
         db_table = "order_item"
         verbose_name = _("order_item")
+        indexes = [
+            # Items polled by Extract, by product of the provider in the order they're handed out
+            models.Index(
+                fields=["product", "order", "id"],
+                name="order_item_extract_poll",
+                condition=models.Q(status__in=["PENDING", "IN_EXTRACT"]),
+            ),
+            # Validation of an item by its token
+            models.Index(
+                fields=["token"],
+                name="order_item_validation_token",
+                condition=models.Q(status="VALIDATION_PENDING"),
+            ),
+        ]
 
     @property
     def available_formats(self):
-        queryset = ProductFormat.objects.filter(product=self.product).values_list(
-            "data_format__name", flat=True
+        return catalogue.cached(
+            ("available_formats", self.product_id),
+            lambda: list(ProductFormat.objects.filter(product_id=self.product_id).values_list(
+                "data_format__name", flat=True
+            )),
         )
-        return list(queryset)
+
+    def use_catalogue(self):
+        """
+        Takes product, pricing and order type from the catalogue scope so they're
+        fetched once for all the items priced during a request
+        """
+        product = catalogue.get_related(self, "product")
+        if product is not None:
+            catalogue.get_related(product, "pricing")
+        if self.order is not None:
+            catalogue.get_related(self.order, "order_type")
 
     def _get_price_values(self, price_value):
         if self.price_status == OrderItem.PricingStatus.PENDING:
@@ -965,26 +1485,49 @@ class OrderItem(models.Model):
     def base_fee(self):
         return self._get_price_values(self._base_fee)
 
-    def _calculate_nested_price(self, group_of_products: Product):
+    def _get_product_price(self, product: Product, prices=None):
+        """
+        Returns price and base fee of a product, taken from prices computed
+        beforehand by Pricing.get_prices when available
+        """
+        if prices is not None and product.pricing_id in prices:
+            return prices[product.pricing_id]
+        return product.pricing.get_price(self.order.geom)
+
+    def _calculate_nested_price(self, group_of_products: Product, prices=None, leaf_products=None):
         """
         Sums all levels of nested prices inside a group of products
-        to _self_price and sets _base_fee for the group
+        to _self_price and sets _base_fee for the group.
+        leaf_products may hold the products of the group found beforehand by
+        Product.get_leaf_products.
         """
-        for product in group_of_products.products.all():
-            if product.products.exists():
-                self._calculate_nested_price(product)
-                continue
-            if product.geom.intersects(self.order.geom):
-                price, base_fee = product.pricing.get_price(self.order.geom)
-                if price:
-                    self._price += price
-                if base_fee and base_fee > self._base_fee:
-                    self._base_fee = base_fee
-
-    def set_price(self, price=None, base_fee=None):
+        if leaf_products is None:
+            leaf_products = Product.get_leaf_products(
+                [group_of_products], self.order.geom)[group_of_products.id]
+        for product in leaf_products:
+            price, base_fee = self._get_product_price(product, prices)
+            if price:
+                self._price += price
+            if base_fee and base_fee > self._base_fee:
+                self._base_fee = base_fee
+
+    def is_priced_by_order_type(self):
         """
-        Sets price and updates price status
+        True when the price doesn't come from the product pricing but from the order:
+        free for subscribers or quote, free for public authorities and academic purposes
         """
+        order_type = self.order.order_type.name
+        if order_type == "Utilisateur permanent" and self.product.free_when_subscribed:
+            return True
+        return order_type in FREE_ORDER_TYPES
+
+    def set_price(self, price=None, base_fee=None, prices=None, leaf_products=None):
+        """
+        Sets price and updates price status.
+        prices may hold the result of Pricing.get_prices for the whole cart,
+        leaf_products the products inside the group as given by Product.get_leaf_products.
+        """
+        self.use_catalogue()
         self._price = None
         self._base_fee = None
         self.price_status = OrderItem.PricingStatus.PENDING
@@ -1005,12 +1548,7 @@ class OrderItem(models.Model):
                 return
 
         # prices are 0 when order is for public authorities or academic purposes
-        if self.order.order_type.name in (
-            "Communal",
-            "Cantonal",
-            "Fédéral",
-            "Académique",
-        ):
+        if self.order.order_type.name in FREE_ORDER_TYPES:
             self._price = Money(0, settings.DEFAULT_CURRENCY)
             self._base_fee = Money(0, settings.DEFAULT_CURRENCY)
             self.price_status = OrderItem.PricingStatus.CALCULATED
@@ -1026,10 +1564,10 @@ class OrderItem(models.Model):
                 # each price will be set individually
                 self._price = Money(0, settings.DEFAULT_CURRENCY)
                 self._base_fee = Money(0, settings.DEFAULT_CURRENCY)
-                self._calculate_nested_price(self.product)
+                self._calculate_nested_price(self.product, prices, leaf_products)
             else:
-                self._price, self._base_fee = self.product.pricing.get_price(
-                    self.order.geom
+                self._price, self._base_fee = self._get_product_price(
+                    self.product, prices
                 )
             if self._price is not None:
                 self.price_status = OrderItem.PricingStatus.CALCULATED
@@ -1119,6 +1657,7 @@ class ProductFormat(models.Model):
         db_table = "product_format"
         unique_together = (("product", "data_format"),)
         verbose_name = _("product_format")
+        triggers = [catalogue_version_trigger()]
 
 
 class UserChange(AbstractIdentity):
@@ -0,0 +1,283 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import BooleanField, Expression, F, Q, Value
+from django.utils.encoding import force_str
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class RowComparison(Expression):
+    """
+    Row value comparison `(a, b, ...) < (x, y, ...)`. Postgres answers it with a
+    range scan of an index on (a, b, ...), where the equivalent
+    `a < x OR (a = x AND b < y)` can only read the index from its start.
+    """
+    output_field = BooleanField()
+    conditional = True
+
+    def __init__(self, fields, operator, values):
+        super().__init__()
+        self.lhs = [F(field) for field in fields]
+        self.operator = operator
+        self.values = list(values)
+
+    def get_source_expressions(self):
+        return self.lhs
+
+    def set_source_expressions(self, exprs):
+        self.lhs = list(exprs)
+
+    def as_sql(self, compiler, connection):
+        sql, params = [], []
+        for expression in self.lhs:
+            expression_sql, expression_params = compiler.compile(expression)
+            sql.append(expression_sql)
+            params.extend(expression_params)
+        values_sql = []
+        for expression, value in zip(self.lhs, self.values):
+            # Cursor values are sent as the type of their column
+            value_sql, value_params = compiler.compile(Value(value, output_field=expression.output_field))
+            values_sql.append(value_sql)
+            params.extend(value_params)
+        return '(%s) %s (%s)' % (', '.join(sql), self.operator, ', '.join(values_sql)), params
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates on the values of the ordering fields of the last item of a page
+    (keyset or "seek" pagination). The next page is found through the ordering
+    instead of skipping rows with OFFSET, so deep pages cost as much as the first.
+
+    Rows are ordered as the queryset, or its model by default, then by pk.
+    Only forward links are given.
+    """
+    cursor_query_param = 'cursor'
+    cursor_query_description = _('The pagination cursor value.')
+    limit_query_param = 'limit'
+    limit_query_description = _('Number of results to return per page.')
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 1000
+    invalid_cursor_message = _('Invalid cursor')
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.default_limit
+        if limit <= 0:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def get_ordering(self, queryset):
+        """
+        Ordering of the queryset, or the default one of its model,
+        ending with pk so rows are never equal
+        """
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not any(field.lstrip('-') in ('pk', queryset.model._meta.pk.name) for field in ordering):
+            descending = bool(ordering) and ordering[0].startswith('-')
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    def is_nullable(self, queryset, name):
+        if name == 'pk':
+            return False
+        try:
+            return queryset.model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            return False
+
+    def decode_cursor(self, request, size):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+        except (UnicodeEncodeError, binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != size:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, values):
+        # str keeps microseconds of datetimes, which DjangoJSONEncoder truncates
+        encoded = json.dumps(values, default=str)
+        return base64.urlsafe_b64encode(encoded.encode('utf-8')).decode('ascii')
+
+    def get_keyset_filter(self, queryset, ordering, values):
+        """
+        Rows coming after values in the ordering:
+        (a, b) > (x, y) when all fields are sorted the same way, else
+        (a > x) OR (a = x AND b > y) OR ...
+        NULLs come last in ascending order and first in descending order, as in Postgres.
+        """
+        descending = [field.startswith('-') for field in ordering]
+        names = [field.lstrip('-') for field in ordering]
+        # A row comparison is NULL as soon as it meets a NULL, which only gives
+        # the right rows when NULLs come first, in descending order
+        if None not in values and len(set(descending)) == 1 and (
+                descending[0] or not any(self.is_nullable(queryset, name) for name in names)):
+            return RowComparison(names, '<' if descending[0] else '>', values)
+
+        conditions = []
+        for index, field in enumerate(ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-')
+            value = values[index]
+            if value is None:
+                if not descending:
+                    continue
+                condition = Q(**{name + '__isnull': False})
+            else:
+                condition = Q(**{name + ('__lt' if descending else '__gt'): value})
+                if not descending and self.is_nullable(queryset, name):
+                    condition |= Q(**{name + '__isnull': True})
+            for previous, previous_value in zip(ordering[:index], values):
+                previous = previous.lstrip('-')
+                if previous_value is None:
+                    condition &= Q(**{previous + '__isnull': True})
+                else:
+                    condition &= Q(**{previous: previous_value})
+            conditions.append(condition)
+        return reduce(lambda left, right: left | right, conditions)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*ordering)
+        values = self.decode_cursor(request, len(ordering))
+        if values is not None:
+            queryset = queryset.filter(self.get_keyset_filter(queryset, ordering, values))
+        results = list(queryset[:self.limit + 1])
+        self.next_values = None
+        if len(results) > self.limit:
+            results = results[:self.limit]
+            last = results[-1]
+            self.next_values = [getattr(last, field.lstrip('-')) for field in ordering]
+        return results
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_values))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(self.cursor_query_description),
+                'schema': {
+                    'type': 'string',
+                },
+            },
+            {
+                'name': self.limit_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(self.limit_query_description),
+                'schema': {
+                    'type': 'integer',
+                },
+            },
+        ]
+
+
+class LimitOffsetOrCursorPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination with two opt-in modes for long listings:
+     - `?cursor=` switches to KeysetPagination, pass it empty for the first page;
+     - `?count=false` skips counting all the results, `count` is then null.
+    """
+    count_query_param = 'count'
+    count_query_description = _('false to skip counting all the results.')
+    keyset_pagination_class = KeysetPagination
+
+    def skip_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('0', 'false')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        if self.keyset_pagination_class.cursor_query_param in request.query_params:
+            self.keyset = self.keyset_pagination_class()
+            self.display_page_controls = False
+            return self.keyset.paginate_queryset(queryset, request, view)
+        if not self.skip_count(request):
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.count = None
+        self.display_page_controls = False
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        return results[:self.limit]
+
+    def get_next_link(self):
+        if self.count is not None:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.offset_query_param, self.offset + self.limit)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count']['nullable'] = True
+        return response_schema
+
+    def get_schema_operation_parameters(self, view):
+        return super().get_schema_operation_parameters(view) + [
+            {
+                'name': self.count_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str(self.count_query_description),
+                'schema': {
+                    'type': 'boolean',
+                },
+            },
+            self.keyset_pagination_class().get_schema_operation_parameters(view)[0],
+        ]
@@ -1,5 +1,57 @@
 from rest_framework import permissions
 from django.conf import settings
+from django.core.cache import cache
+
+
+def _access_cache_key(user_id):
+    return 'user-access-{}'.format(user_id)
+
+
+def get_user_access(user):
+    """
+    Returns a snapshot of the group names and permissions of user. It is kept on
+    the user instance, so for the request it was authenticated by, and also in the
+    cache for PERMISSIONS_CACHE_TTL seconds if set (see api.signals).
+    """
+    if not user.is_authenticated:
+        return {'groups': frozenset(), 'permissions': frozenset()}
+    access = getattr(user, '_access_snapshot', None)
+    if access is not None:
+        return access
+    cache_key = _access_cache_key(user.pk)
+    if settings.PERMISSIONS_CACHE_TTL:
+        access = cache.get(cache_key)
+    if access is None:
+        access = {
+            'groups': frozenset(user.groups.values_list('name', flat=True)),
+            'permissions': frozenset(user.get_all_permissions()),
+        }
+        if settings.PERMISSIONS_CACHE_TTL:
+            cache.set(cache_key, access, settings.PERMISSIONS_CACHE_TTL)
+    user._access_snapshot = access
+    return access
+
+
+def has_perm(user, perm):
+    """
+    Same as user.has_perm(perm), answered from the snapshot of user access
+    """
+    return perm in get_user_access(user)['permissions']
+
+
+def get_user_groups(user):
+    """
+    Names of the groups of user, taken from its access token when it was
+    authenticated by api.authentication.StatelessJWTAuthentication
+    """
+    groups = getattr(user, 'token_groups', None)
+    if groups is None:
+        groups = get_user_access(user)['groups']
+    return groups
+
+
+def clear_user_access(user_ids):
+    cache.delete_many([_access_cache_key(user_id) for user_id in user_ids])
 
 
 class ExtractGroupPermission(permissions.BasePermission):
@@ -8,8 +60,7 @@ class ExtractGroupPermission(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
-        queryset = request.user.groups.values_list('name', flat=True)
-        return 'extract' in list(queryset)
+        return 'extract' in get_user_groups(request.user)
 
 class InternalGroupObjectPermission(permissions.BasePermission):
     """
@@ -20,6 +71,6 @@ class InternalGroupObjectPermission(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if obj.accessibility in settings.METADATA_PUBLIC_ACCESSIBILITIES:
             return True
-        if request.user.has_perm('api.view_internal'):
+        if has_perm(request.user, 'api.view_internal'):
             return True
         return False
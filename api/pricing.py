@@ -1,6 +1,9 @@
 import logging
+from django.apps import apps
 from django.contrib.gis.db.models.functions import Area, Intersection
-from django.db.models import ExpressionWrapper, F, Sum
+from django.db.models import (
+    Case, Count, ExpressionWrapper, Exists, F, IntegerField, OuterRef, Subquery, Sum, Value, When)
+from django.db.models.functions import Coalesce
 from djmoney.models.fields import MoneyField
 from djmoney.money import Money
 from django.utils.translation import gettext_lazy as _
@@ -16,6 +19,10 @@ class ProductPriceCalculator():
     models.Pricing.PricingType class to the get price method.
     """
 
+    # Pricing types whose price depends on the pricing layer and that can
+    # be computed for a whole cart with one set-based query
+    SET_BASED_PRICING_TYPES = ('BY_NUMBER_OBJECTS', 'FROM_PRICING_LAYER')
+
     @classmethod
     def get_price(cls, **kwargs):
         """
@@ -26,6 +33,69 @@ class ProductPriceCalculator():
         method = getattr(cls, method_name, cls._get_undefined_price)
         return method(**kwargs)
 
+    @classmethod
+    def get_prices(cls, polygon, pricing_instances):
+        """
+        Cart-level counterpart of get_price. Pricings depending on the pricing layer
+        are computed all at once with a single query grouped by pricing, the other
+        ones are delegated to get_price as they do not need any query.
+        Returns a dict of prices keyed by pricing id.
+        """
+        pricings = {pricing.id: pricing for pricing in pricing_instances}
+        set_based_values = cls._get_set_based_values(polygon, [
+            pricing.id for pricing in pricings.values()
+            if pricing.pricing_type in cls.SET_BASED_PRICING_TYPES
+        ])
+        prices = {}
+        for pricing_id, pricing in pricings.items():
+            values = set_based_values.get(pricing_id)
+            if values is None:
+                prices[pricing_id] = cls.get_price(pricing_instance=pricing, polygon=polygon)
+            elif pricing.pricing_type == 'BY_NUMBER_OBJECTS':
+                prices[pricing_id] = pricing.unit_price * values['objects_within']
+            elif not values['has_geometries']:
+                prices[pricing_id] = cls._get_missing_pricing_layer_price(
+                    pricing_instance=pricing, polygon=polygon)
+            else:
+                prices[pricing_id] = Money(values['layer_sum'], pricing.unit_price_currency)
+        return prices
+
+    @staticmethod
+    def _get_set_based_values(polygon, pricing_ids):
+        """
+        Number of objects within the polygon and sum of intersected pricing areas
+        for each pricing, as computed by _get_by_number_objects_price and
+        _get_from_pricing_layer_price, in one query.
+        """
+        if not pricing_ids:
+            return {}
+        pricing_model = apps.get_model('api', 'Pricing')
+        geometries = apps.get_model('api', 'PricingGeometry').objects.filter(pricing=OuterRef('pk'))
+        geometry_parts = apps.get_model('api', 'PricingGeometrySubdivided').objects.filter(
+            pricing=OuterRef('pk'))
+        rows = pricing_model.objects.filter(id__in=pricing_ids).annotate(
+            has_geometries=Exists(geometries),
+            objects_within=Case(
+                When(pricing_type='BY_NUMBER_OBJECTS', then=Coalesce(Subquery(
+                    geometries.filter(geom__within=polygon).values('pricing').annotate(
+                        count=Count('id')
+                    ).values('count')
+                ), Value(0))),
+                output_field=IntegerField(),
+            ),
+            layer_sum=Case(
+                When(pricing_type='FROM_PRICING_LAYER', then=Subquery(
+                    geometry_parts.filter(geom__intersects=polygon).values('pricing').annotate(
+                        sum=ExpressionWrapper(Sum(
+                            (Area(Intersection('geom', polygon))/10000)*F('pricing_geometry__unit_price')
+                        ), output_field=MoneyField())
+                    ).values('sum')
+                )),
+                output_field=MoneyField(),
+            ),
+        ).values('id', 'has_geometries', 'objects_within', 'layer_sum')
+        return {row['id']: row for row in rows}
+
     @classmethod
     def _get_undefined_price(cls, **kwargs):
         pricing_instance = kwargs.get('pricing_instance')
@@ -89,28 +159,37 @@ class ProductPriceCalculator():
         pricing_instance = kwargs.get('pricing_instance')
         pricing_geometry_instance = pricing_instance.pricinggeometry_set
         if pricing_geometry_instance.count() == 0:
-            LOGGER.info('%s HAS NO GEOMETRIES LINKED TO IT', pricing_instance.name)
-            send_geoshop_email(
-                _('Geoshop - Error, pricing has no geometries linked to it'),
-                template_name='email_admin',
-                template_data={
-                    'messages': [
-                        _('The pricing "{}" is defined but no geometries were found for it.').format(
-                            pricing_instance.name)
-                    ]
-                }
-            )
-            return cls._get_manual_price(**kwargs)
-        total = pricing_geometry_instance.filter(
+            return cls._get_missing_pricing_layer_price(**kwargs)
+        # Large pricing areas are intersected by parts, see PricingGeometrySubdivided
+        total = apps.get_model('api', 'PricingGeometrySubdivided').objects.filter(
             pricing=pricing_instance.id
         ).filter(
             geom__intersects=polygon
         ).aggregate(sum=ExpressionWrapper(Sum(
-            (Area(Intersection('geom', polygon))/10000)*F('unit_price')
+            (Area(Intersection('geom', polygon))/10000)*F('pricing_geometry__unit_price')
         ), output_field=MoneyField()))
 
         return Money(total['sum'], pricing_instance.unit_price_currency)
 
+    @classmethod
+    def _get_missing_pricing_layer_price(cls, **kwargs):
+        """
+        A pricing layer without any geometry cannot be priced, admins are warned
+        """
+        pricing_instance = kwargs.get('pricing_instance')
+        LOGGER.info('%s HAS NO GEOMETRIES LINKED TO IT', pricing_instance.name)
+        send_geoshop_email(
+            _('Geoshop - Error, pricing has no geometries linked to it'),
+            template_name='email_admin',
+            template_data={
+                'messages': [
+                    _('The pricing "{}" is defined but no geometries were found for it.').format(
+                        pricing_instance.name)
+                ]
+            }
+        )
+        return cls._get_manual_price(**kwargs)
+
     @staticmethod
     def _get_manual_price(**kwargs):
         return None
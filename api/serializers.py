@@ -1,5 +1,5 @@
 import json
-import copy
+import functools
 from shapely.geometry.polygon import Polygon
 
 from django.conf import settings
@@ -7,7 +7,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import PasswordResetForm, SetPasswordForm
 from django.contrib.auth.tokens import default_token_generator
 from django.contrib.gis.gdal import GDALException
-from django.contrib.gis.geos import Polygon, MultiPolygon, GEOSException, GEOSGeometry, WKTWriter
+from django.contrib.gis.geos import Polygon, GEOSException, GEOSGeometry, WKTWriter
 from django.utils.translation import gettext_lazy as _
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
@@ -20,7 +20,7 @@ from allauth.account.adapter import get_adapter
 
 from .helpers import send_geoshop_email, zip_all_orderitems
 from .models import (
-    Copyright, Contact, Document, DataFormat, Group, Identity,
+    Copyright, Contact, Document, DataFormat, Identity,
     Metadata, MetadataCategoryEch, MetadataContact, Order, OrderItem, OrderType,
     Pricing, Product, ProductFormat, ProductOwnership, UserChange)
 
@@ -32,6 +32,32 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=settings.GEOMETRY_REPRESENTATION_CACHE_SIZE)
+def _polygon_representation(ewkb) -> str:
+    """
+    WKT of a polygon in EPSG:4326, simplified for large polygons.
+    Keyed by EWKB (coordinates and SRID) as the same order geometries are
+    serialized many times (order lists, every item fetched by Extract).
+    """
+    new_value = GEOSGeometry(memoryview(ewkb))
+    wkt_w = WKTWriter()
+
+    # Use buffer and Douglas-Peucker to simplify geom (one vertex 0.2m) for large polygons
+    # The smallest Cadastre has 156 vertices
+    # TODO is this generally true or only for NE?
+    if new_value.num_coords > 156:
+        new_value = new_value.buffer(0.5)
+        new_value = new_value.simplify(0.2, preserve_topology=False)
+        wkt_w.precision = 6
+    new_value.transform(4326)
+
+    # number of decimals
+
+    if new_value.area > 0:
+        return wkt_w.write(new_value).decode()
+    return 'POLYGON EMPTY'
+
+
 class WKTPolygonField(serializers.Field):
     """
     Polygons are serialized to POLYGON((Long, Lat)) notation
@@ -40,23 +66,7 @@ class WKTPolygonField(serializers.Field):
     def to_representation(self, value) -> str:
         if isinstance(value, dict) or value is None:
             return value
-        new_value = copy.copy(value)
-        wkt_w = WKTWriter()
-
-        # Use buffer and Douglas-Peucker to simplify geom (one vertex 0.2m) for large polygons
-        # The smallest Cadastre has 156 vertices
-        # TODO is this generally true or only for NE?
-        if new_value.num_coords > 156:
-            new_value = new_value.buffer(0.5)
-            new_value = new_value.simplify(0.2, preserve_topology=False)
-            wkt_w.precision = 6
-        new_value.transform(4326)
-
-        # number of decimals
-
-        if new_value.area > 0:
-            return wkt_w.write(new_value).decode()
-        return 'POLYGON EMPTY'
+        return _polygon_representation(bytes(value.ewkb))
 
     def to_internal_value(self, value):
         if value == '' or value is None:
@@ -205,11 +215,10 @@ class MetadataSerializer(serializers.HyperlinkedModelSerializer):
 
     def get_contact_persons(self, obj) -> List[Dict[str, str]]:
         """obj is a Metadata instance. Returns list of dicts"""
-        qset = MetadataContact.objects.filter(metadata=obj)
-        return [
-            MetadataContactSerializer(m, context={
+        return MetadataContactSerializer(
+            obj.metadatacontact_set.all(), many=True, context={
                 'request': self.context['request']
-            }).data for m in qset]
+            }).data
 
     def get_legend_link(self, obj) -> str:
         return obj.get_legend_link()
@@ -266,7 +275,8 @@ class OrderItemSerializer(serializers.ModelSerializer):
         model = OrderItem
         exclude = ['_price_currency', '_price', '_base_fee_currency',
                    '_base_fee', 'last_download', 'extract_result',
-                   'validation_date', 'token']
+                   'validation_date', 'token',
+                   'extract_worker', 'extract_lease_expiry']
         read_only_fields = ['price_status', 'order']
 
 
@@ -312,37 +322,24 @@ class OrderSerializer(serializers.ModelSerializer):
             [xy[0:2] for xy in list(attrs['geom'].coords[0])],
             srid=settings.DEFAULT_SRID
         )
-        relevantOwnedAreas = ProductOwnership.objects.filter(
-            product__in=[ item['product'] for item in attrs['items']],
-            user_group__in=Group.objects.filter(user=self.context.get('request').user)
-        ).all()
-
-        ownedByProduct = {}
-        for area in relevantOwnedAreas:
-            ownedByProduct[area.product.label] = area.geom
+        limitedProducts = [
+            item['product'] for item in attrs['items']
+            # If max_order_area is zero, then product doesn't have limit by ordered area
+            if item['product'].max_order_area
+        ]
+        # If product is not owned by user, then whole ordered area is excluded
+        excludedAreas, excludedFromOrder = ProductOwnership.get_excluded_areas(
+            requestedGeom, limitedProducts, self.context.get('request').user)
 
         allowedToQuery = 0
         excludedOverflow = 0
-        excludedFromOrder = Polygon(
-            [xy[0:2] for xy in list(attrs['geom'].coords[0])],
-            srid=settings.DEFAULT_SRID,
-        )
-        for item in attrs['items']:
-            product = item['product']
-            # If max_order_area is zero, then product doesn't have limit by ordered area
-            if not product.max_order_area:
-                continue
-
-            # If product is not owned by user, then whole ordered area is excluded
-            ownedArea = ownedByProduct.get(product.label, MultiPolygon(srid=settings.DEFAULT_SRID))
-            excludedFromItem = requestedGeom.difference(ownedArea)
-            excludedFromOrder = excludedFromOrder.difference(ownedArea)
-
+        for product in limitedProducts:
+            excludedFromItem, ownedArea = excludedAreas[product.id]
             # If excluded area is less than max order area, then we can ignore it
-            if excludedFromItem.area <= product.max_order_area:
+            if excludedFromItem <= product.max_order_area:
                 continue
-            excludedOverflow += excludedFromItem.area - product.max_order_area
-            allowedToQuery += (ownedArea.area + product.max_order_area)
+            excludedOverflow += excludedFromItem - product.max_order_area
+            allowedToQuery += (ownedArea + product.max_order_area)
 
         attrs['excludedGeom'] = excludedFromOrder
         if (excludedOverflow > 0):
@@ -385,10 +382,9 @@ class OrderSerializer(serializers.ModelSerializer):
                     }
                 }
             )
-        for item_data in items_data:
-            item = OrderItem.objects.create(order=order, **item_data)
-            item.set_price()
-            item.save()
+        order.set_items_price([
+            OrderItem.objects.create(order=order, **item_data) for item_data in items_data
+        ])
 
         if order.order_type and items_data:
             order.set_price()
@@ -435,6 +431,7 @@ class OrderSerializer(serializers.ModelSerializer):
                     existing_item.delete()
 
         if items_data:
+            oi_instances = []
             for item_data in items_data:
                 oi_instance, created = OrderItem.objects.get_or_create(
                     order=instance,
@@ -444,8 +441,9 @@ class OrderSerializer(serializers.ModelSerializer):
                     'data_format', oi_instance.data_format)
                 oi_instance.product = item_data.get(
                     'product', oi_instance.product)
-                oi_instance.set_price()
-                oi_instance.save()
+                oi_instance.order = instance
+                oi_instances.append(oi_instance)
+            instance.set_items_price(oi_instances)
 
         instance.set_price()
         instance.save()
@@ -506,6 +504,18 @@ class ProductSerializer(serializers.ModelSerializer):
         exclude = ['order', 'ts', 'geom']
 
 
+class ProductAutocompleteSerializer(serializers.ModelSerializer):
+    """
+    Light product serializer for autocomplete suggestions
+    """
+    metadata_name = serializers.CharField(source='metadata.name', read_only=True)
+    similarity = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'label', 'metadata_name', 'thumbnail_link', 'similarity']
+
+
 class ProductExtractSerializer(ProductSerializer):
     """
     Product serializer without geom
@@ -533,7 +543,8 @@ class ExtractOrderItemSerializer(OrderItemSerializer):
     class Meta(OrderItemSerializer.Meta):
         exclude = ['_price_currency', '_base_fee_currency',
                    '_price', '_base_fee', 'order', 'status',
-                   'last_download', 'price_status']
+                   'last_download', 'price_status',
+                   'extract_worker', 'extract_lease_expiry']
         read_only_fields = [
             'id', 'data_format', 'product', 'srid']
 
@@ -550,6 +561,8 @@ class ExtractOrderItemSerializer(OrderItemSerializer):
             instance.status = OrderItem.OrderItemStatus.PROCESSED
         if instance.extract_result:
             instance.extract_result_size = instance.extract_result.size
+        # Item is done, it must not be handed out again
+        instance.extract_lease_expiry = None
         instance.save()
         status = instance.order.next_status_on_extract_input()
         if status == Order.OrderStatus.PROCESSED:
@@ -1,8 +1,10 @@
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_save, pre_delete
 from django.dispatch import receiver
 
 from api.models import Identity, Order, OrderItem
+from api.permissions import clear_user_access
 
 UserModel = get_user_model()
 
@@ -20,3 +22,48 @@ def copy_identity_email(sender, instance, **kwargs):
     if instance.user:
         instance.user.email = instance.email
         instance.user.save()
+
+@receiver(post_save, sender=UserModel)
+def clear_user_access_on_save(sender, instance, **kwargs):
+    """
+    Drop the cached access of a user whose status (active, superuser...) may have changed
+    """
+    instance.__dict__.pop('_access_snapshot', None)
+    clear_user_access([instance.pk])
+
+@receiver(m2m_changed, sender=UserModel.groups.through)
+@receiver(m2m_changed, sender=UserModel.user_permissions.through)
+def clear_user_access_on_user_change(sender, instance, action, model, pk_set, **kwargs):
+    """
+    Drop the cached access of users whose groups or permissions changed
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, UserModel):
+        instance.__dict__.pop('_access_snapshot', None)
+        clear_user_access([instance.pk])
+    elif pk_set:
+        # Changed from the other side, e.g. group.user_set.add(user)
+        clear_user_access(pk_set)
+    else:
+        clear_user_access(instance.user_set.values_list('pk', flat=True))
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def clear_user_access_on_group_change(sender, instance, action, model, pk_set, **kwargs):
+    """
+    Drop the cached access of the members of groups whose permissions changed
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if isinstance(instance, Group):
+        users = instance.user_set.all()
+    elif pk_set:
+        # Changed from the permission side, e.g. permission.group_set.add(group)
+        users = UserModel.objects.filter(groups__in=pk_set)
+    else:
+        users = UserModel.objects.filter(groups__permissions=instance)
+    clear_user_access(users.values_list('pk', flat=True))
+
+@receiver(pre_delete, sender=Group)
+def clear_user_access_on_group_delete(sender, instance, **kwargs):
+    clear_user_access(instance.user_set.values_list('pk', flat=True))
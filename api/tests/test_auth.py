@@ -1,17 +1,23 @@
 import os
 import json
 import requests
+import shutil
+import tempfile
 import unittest
 from django.conf import settings
+from django.core.cache import cache
 from unittest import mock
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from django.urls import reverse
+from api.authentication import StatelessJWTAuthentication
 from api.models import Identity
+from oidc import PrivateKeyStore
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
 UserModel = get_user_model()
-requestsPost = requests.post
 
 
 def mockResponse(content):
@@ -58,11 +64,43 @@ class AuthViewsTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
         self.assertEqual(response.data["username"], self.username, "Gets his username")
 
+    def test_stateless_jwt_authentication(self):
+        user = UserModel.objects.create_user(
+            username=self.username, email="test@example.com", password=self.password
+        )
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"username": self.username, "password": self.password}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        access = AccessToken(response.data["access"])
+        self.assertEqual(access["username"], self.username)
+        self.assertEqual(access["groups"], [])
+
+        request = APIRequestFactory().get(
+            "/", HTTP_AUTHORIZATION="Bearer {0}".format(response.data["access"]))
+        with self.assertNumQueries(0):
+            authenticated, _ = StatelessJWTAuthentication().authenticate(request)
+        self.assertEqual(authenticated.pk, user.pk)
+        self.assertEqual(authenticated.get_username(), self.username)
+        with self.assertNumQueries(1):
+            self.assertEqual(authenticated.email, "test@example.com", "Other fields are loaded lazily")
+        with self.assertNumQueries(0):
+            self.assertFalse(authenticated.is_superuser, "All other fields are loaded at once")
+            self.assertEqual(authenticated.first_name, user.first_name)
+
+        user.groups.add(Group.objects.get_or_create(name="extract")[0])
+        with self.assertNumQueries(2):
+            # The user and its groups
+            response = self.client.post(
+                reverse("token_refresh"), {"refresh": response.data["refresh"]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(AccessToken(response.data["access"])["groups"], ["extract"])
 
 @unittest.skipUnless(settings.FEATURE_FLAGS.get("oidc"), "OIDC tests disabled in settings")
 class OidcAuthTests(APITestCase):
 
     def setUp(self):
+        cache.clear()
         self.email = os.environ.get("EMAIL_TEST_TO", "test@example.com")
         self.fakeUser = {
             "email": self.email,
@@ -71,7 +109,7 @@ class OidcAuthTests(APITestCase):
         }
 
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_oidc_createuser(self, mock_post):
         mock_post.return_value = mockResponse(self.fakeUser)
         url = reverse("oidc_validate_token")
@@ -97,7 +135,7 @@ class OidcAuthTests(APITestCase):
             identity,
         )
 
-    @mock.patch("requests.post")
+    @mock.patch("requests.Session.post")
     def test_oidc_updateuser(self, mock_post):
         existing_user = UserModel.objects.create_user(username=self.email, email=self.email)
         existing_user.save()
@@ -130,6 +168,36 @@ class OidcAuthTests(APITestCase):
             identity,
         )
 
+    @mock.patch("requests.Session.post")
+    def test_oidc_introspection_cached(self, mock_post):
+        mock_post.return_value = mockResponse(self.fakeUser)
+        url = reverse("oidc_validate_token")
+        for token in ["fake_token", "fake_token", "other_token"]:
+            response = self.client.post(url, data={"token": token}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(mock_post.call_count, 2, "Same token is introspected once")
+        assertions = [call.kwargs["data"]["client_assertion"] for call in mock_post.call_args_list]
+        self.assertEqual(assertions[0], assertions[1], "Client assertion is reused")
+
+        mock_post.reset_mock()
+        mock_post.return_value = mockResponse({"active": False})
+        for _ in range(2):
+            response = self.client.post(url, data={"token": "revoked_token"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED, response.content)
+        self.assertEqual(mock_post.call_count, 2, "Inactive tokens are not cached")
+
+    def test_private_key_loaded_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            keyfile = shutil.copy(settings.OIDC_PRIVATE_KEYFILE, directory)
+            store = PrivateKeyStore(keyfile)
+            key, version = store.get()
+            self.assertIs(store.get()[0], key, "Key is parsed once")
+
+            os.utime(keyfile, ns=(version + 10**9, version + 10**9))
+            reloaded, reloaded_version = store.get()
+            self.assertIsNot(reloaded, key, "Key is read again when the file changes")
+            self.assertNotEqual(reloaded_version, version)
+
     # def test_noauth_401(self):
     #     url = reverse("validate-order")
     #     response = self.client.get(url, {"format": "json"})
@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from api import catalogue
+from api.models import CatalogueVersion, Identity, OrderItem, Pricing, Product
+from api.tests.factories import BaseObjectsFactory
+
+
+class CatalogueTests(APITestCase):
+    """
+    Test catalogue objects shared during a request
+    """
+
+    def setUp(self):
+        self.config = BaseObjectsFactory()
+        self.product = self.config.products['single']
+
+    @override_settings(CATALOGUE_CACHE_ENABLED=False)
+    def test_fetched_once_in_scope(self):
+        with self.assertNumQueries(2):
+            catalogue.get(Product, self.product.id)
+            catalogue.get(Product, self.product.id)
+        with catalogue.scope():
+            with self.assertNumQueries(1):
+                first = catalogue.get(Product, self.product.id)
+                second = catalogue.get(Product, self.product.id)
+        self.assertIs(first, second)
+
+    def test_items_share_catalogue(self):
+        items = [
+            OrderItem.objects.create(order=self.config.order, product=self.product)
+            for _ in range(3)
+        ]
+        items = list(OrderItem.objects.filter(id__in=[item.id for item in items]))
+        with catalogue.scope():
+            for item in items:
+                item.use_catalogue()
+                item.available_formats
+            self.assertIs(items[0].product, items[2].product)
+            self.assertIsInstance(items[0].product.pricing, Pricing)
+            with self.assertNumQueries(0):
+                for item in items:
+                    self.assertEqual(item.product.pricing.pricing_type, 'SINGLE')
+                    self.assertCountEqual(item.available_formats, ['DXF', 'DWG'])
+
+    def test_kept_until_catalogue_changes(self):
+        with catalogue.scope():
+            first = catalogue.get(Product, self.product.id)
+        with catalogue.scope():
+            with self.assertNumQueries(1):
+                self.assertIs(catalogue.get(Product, self.product.id), first)
+        Product.objects.filter(id=self.product.id).update(label='Changed label')
+        with catalogue.scope():
+            changed = catalogue.get(Product, self.product.id)
+        self.assertEqual(changed.label, 'Changed label')
+
+    def test_identity_changes_of_providers_only(self):
+        client = get_user_model().objects.create_user(username='catalogue_client')
+        version = CatalogueVersion.objects.get().version
+        Identity.objects.filter(user=client).update(company_name='Client company')
+        self.assertEqual(CatalogueVersion.objects.get().version, version, 'Clients do not change the catalogue')
+        Identity.objects.filter(user=self.config.provider).update(company_name='Provider company')
+        self.assertNotEqual(CatalogueVersion.objects.get().version, version, 'Providers change the catalogue')
+
+    def test_products_served_from_memory(self):
+        url = reverse('product-list')
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertIn(self.product.label, [product['label'] for product in response.data['results']])
+
+        self.product.product_status = Product.ProductStatus.DRAFT
+        self.product.save()
+        response = self.client.get(url)
+        self.assertNotIn(self.product.label, [product['label'] for product in response.data['results']])
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.product.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+
+    def test_conditional_get(self):
+        url = reverse('product-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url + '?limit=1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Other pages have other ETags')
+
+        Product.objects.filter(id=self.product.id).update(label='Changed label')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_search_response_cached(self):
+        url = reverse('product-list')
+        response = self.client.get(url, {'search': 'Produit forf'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual([product['label'] for product in response.data['results']], [self.product.label])
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'search': 'produit  forf'})
+        self.assertEqual([product['label'] for product in response.data['results']], [self.product.label])
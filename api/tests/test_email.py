@@ -0,0 +1,27 @@
+from unittest import mock
+from django.core import mail
+from django.test import SimpleTestCase
+from api import helpers
+
+
+class EmailTests(SimpleTestCase):
+    """
+    Test email rendering
+    """
+
+    def test_email_rendered_once(self):
+        with mock.patch.object(helpers, '_render_email_templates', wraps=helpers._render_email_templates) as render:
+            sent = helpers.send_geoshop_bulk_email(
+                'Hello',
+                ['user1@example.com', 'user2@example.com', 'user1@example.com'],
+                template_name='email_admin',
+                template_data={'messages': ['First line', 'Fish & chips']})
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(sent, 2, 'Duplicate recipients receive a single email')
+        self.assertEqual([email.to for email in mail.outbox], [['user1@example.com'], ['user2@example.com']])
+        body = mail.outbox[0].body
+        self.assertIn('Fish & chips', body)
+        self.assertNotIn('<', body, 'Plain text alternative has no markup')
+        html_message, mimetype = mail.outbox[0].alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('<p>First line</p>', html_message)
@@ -0,0 +1,41 @@
+from unittest import mock
+from django.core import mail
+from django.test import TestCase, override_settings
+from api.helpers import flush_email_outbox, send_geoshop_email
+from api.models import OutgoingEmail
+
+
+@override_settings(EMAIL_OUTBOX_ENABLED=True, EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_DELAY=0)
+class EmailOutboxTests(TestCase):
+    """
+    Test emails sent through the outbox
+    """
+
+    def test_email_is_queued(self):
+        send_geoshop_email('Hello', message='World', recipient='user@example.com')
+        send_geoshop_email('Hello', message='World', recipient='user@example.com')
+        self.assertEqual(len(mail.outbox), 0, 'Nothing is sent during the request')
+        self.assertEqual(OutgoingEmail.objects.count(), 1, 'Same email is queued once per recipient')
+
+        self.assertEqual(flush_email_outbox(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['user@example.com'])
+        self.assertEqual(mail.outbox[0].body, 'World')
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.status, OutgoingEmail.OutgoingEmailStatus.SENT)
+        self.assertIsNotNone(email.date_sent)
+        self.assertEqual(flush_email_outbox(), 0, 'Sent emails are not sent again')
+
+    def test_email_is_retried(self):
+        send_geoshop_email('Hello', message='World', recipient='user@example.com')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('Down')):
+            self.assertEqual(flush_email_outbox(), 0)
+            email = OutgoingEmail.objects.get()
+            self.assertEqual(email.status, OutgoingEmail.OutgoingEmailStatus.PENDING)
+            self.assertEqual(email.attempts, 1)
+            self.assertEqual(email.last_error, 'Down')
+
+            self.assertEqual(flush_email_outbox(), 0)
+            email.refresh_from_db()
+            self.assertEqual(email.status, OutgoingEmail.OutgoingEmailStatus.FAILED)
+        self.assertEqual(flush_email_outbox(), 0, 'Failed emails are not sent anymore')
@@ -1,15 +1,22 @@
 
 
 import os
-import time
+from io import StringIO
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
+from django.core.management import call_command
 from django.urls import reverse
 from django.core import mail
+from django.utils import timezone
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from rest_framework import status
 from rest_framework.test import APITestCase
-from api.models import DataFormat, OrderItem, Order
+from api import jobs
+from api.helpers import zip_all_orderitems
+from api.models import DataFormat, Job, OrderItem, Order
 from api.tests.factories import BaseObjectsFactory, ExtractFactory
 
 UserModel = get_user_model()
@@ -105,8 +112,8 @@ class OrderTests(APITestCase):
 
         url = reverse('order-download-link', kwargs={'pk': order_id})
 
-        # Full zip takes time on windows
-        time.sleep(1)
+        # Zipping is done by the job queue
+        jobs.run_pending()
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
         self.assertIsNotNone(response.data['download_link'], 'Check file is visible for user')
@@ -116,6 +123,24 @@ class OrderTests(APITestCase):
         self.assertIsNotNone(order.date_downloaded, 'Check if there\'s a last_download date')
 
 
+    def test_zip_order_job_deduped(self):
+        for index, item in enumerate(self.config.order.items.all()):
+            item.extract_result = SimpleUploadedFile(
+                "result{}.zip".format(index), self.empty_zip_data, content_type="multipart/form-data")
+            item.save()
+        zip_all_orderitems(Order.objects.get(pk=self.config.order.id))
+        order = Order.objects.get(pk=self.config.order.id)
+        zip_all_orderitems(order)
+        job = Job.objects.get(dedupe_key='zip_order_{}'.format(order.id))
+        self.assertEqual(
+            Path(job.payload['full_zip_path']), Path(settings.MEDIA_ROOT, order.extract_result.name),
+            'Order points to the zip of the pending job')
+
+        jobs.run_pending()
+        zip_path = Path(settings.MEDIA_ROOT, order.extract_result.name)
+        self.assertTrue(zip_path.exists())
+        self.assertEqual(list(zip_path.parent.glob(zip_path.name + '.*.part')), [])
+
     def test_cancel_order_item(self):
         self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.extract_token)
         url = reverse('extract_order')
@@ -169,6 +194,48 @@ class OrderTests(APITestCase):
         )
 
 
+    def test_fetch_with_limit(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.extract_token)
+        url = reverse('extract_order')
+        response = self.client.get(url, {'limit': 'all'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, response.content)
+
+        response = self.client.get(url, {'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(len(response.data[0]['items']), 1)
+        first_item_id = response.data[0]['items'][0]['id']
+        self.assertEqual(OrderItem.objects.get(pk=first_item_id).status, OrderItem.OrderItemStatus.IN_EXTRACT)
+
+        response = self.client.get(url, {'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(len(response.data[0]['items']), 1)
+        self.assertNotEqual(response.data[0]['items'][0]['id'], first_item_id, 'Item is fetched once')
+
+        response = self.client.get(url, {'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT, response.content)
+
+
+    def test_expired_lease(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.extract_token)
+        url = reverse('extract_order')
+        response = self.client.get(url, {'worker': 'extract-1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        item_ids = [item['id'] for item in response.data[0]['items']]
+        self.assertEqual(OrderItem.objects.get(pk=item_ids[0]).extract_worker, 'extract-1')
+
+        response = self.client.get(url, {'worker': 'extract-2'})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT, 'Leased items are not fetched twice')
+
+        OrderItem.objects.filter(pk=item_ids[0]).update(
+            extract_lease_expiry=timezone.now() - timedelta(seconds=1))
+        response = self.client.get(url, {'worker': 'extract-2'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(
+            [item['id'] for item in response.data[0]['items']], item_ids[:1],
+            'Item whose lease expired is fetched again')
+        self.assertEqual(OrderItem.objects.get(pk=item_ids[0]).extract_worker, 'extract-2')
+
+
     def multi_extract_user_order(self):
         """
         Two different extract users proceeds an order with products from mixed providers
@@ -226,3 +293,11 @@ class OrderTests(APITestCase):
         url = reverse('extract_order')
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT, response.content)
         self.assertEqual(len(mail.outbox), 1, 'An email has been sent to client')
+
+    def test_explain_queries(self):
+        out = StringIO()
+        call_command(
+            'explain_queries', client=self.config.private_username,
+            provider=self.extract_config.username, stdout=out)
+        for name in ['last_draft', 'order_history', 'extract_poll', 'order_download', 'item_validation']:
+            self.assertIn(name, out.getvalue())
@@ -0,0 +1,66 @@
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from api import jobs
+from api.models import Job
+
+CALLS = []
+
+
+@jobs.register('test_ok')
+def _ok_job(value):
+    CALLS.append(value)
+
+
+@jobs.register('test_fail')
+def _failing_job():
+    raise ValueError('Always fails')
+
+
+@override_settings(JOBS_MAX_ATTEMPTS=2, JOBS_RETRY_DELAY=0)
+class JobsTests(TestCase):
+    """
+    Test the database job queue
+    """
+
+    def setUp(self):
+        CALLS.clear()
+
+    def test_enqueue_dedupe(self):
+        job1 = jobs.enqueue('test_ok', payload={'value': 1}, dedupe_key='same')
+        job2 = jobs.enqueue('test_ok', payload={'value': 2}, dedupe_key='same')
+        self.assertEqual(job1.id, job2.id, 'Active job is reused')
+        jobs.run_pending()
+        job3 = jobs.enqueue('test_ok', payload={'value': 3}, dedupe_key='same')
+        self.assertNotEqual(job1.id, job3.id, 'Finished job is not reused')
+
+    def test_run_job(self):
+        job = jobs.enqueue('test_ok', payload={'value': 42})
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.JobStatus.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNotNone(job.date_finished)
+        self.assertEqual(CALLS, [42])
+
+    def test_delayed_job(self):
+        jobs.enqueue('test_ok', payload={'value': 1}, run_after=timezone.now() + timedelta(hours=1))
+        self.assertEqual(jobs.run_pending(), 0, 'Job is not due yet')
+
+    def test_retry_then_fail(self):
+        job = jobs.enqueue('test_fail')
+        self.assertEqual(jobs.run_pending(), 2, 'Job is retried until max attempts')
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.JobStatus.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('Always fails', job.last_error)
+
+    def test_expired_lease(self):
+        job = jobs.enqueue('test_ok', payload={'value': 1})
+        claimed = jobs.claim('dead-worker')
+        self.assertEqual(claimed.id, job.id)
+        self.assertIsNone(jobs.claim('other-worker'), 'Leased job is not claimed twice')
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        reclaimed = jobs.claim('other-worker')
+        self.assertEqual(reclaimed.id, job.id, 'Job of a dead worker is taken again')
+        self.assertEqual(reclaimed.attempts, 2)
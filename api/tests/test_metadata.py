@@ -1,7 +1,11 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth.models import Group
 from rest_framework import status
 from rest_framework.test import APITestCase
+from api.models import Copyright, Document, Metadata, MetadataContact
+from api.permissions import has_perm
 from api.tests.factories import BaseObjectsFactory
 from django.contrib.auth.models import Permission
 
@@ -38,3 +42,107 @@ class MetadataTests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
         self.assertEqual(response.data['count'], 3, 'The two metadatas (public and private) are visible + 1 from echo user')
+
+    def test_view_private_access_cached(self):
+        self.client.login(
+            username=self.config.private_username,
+            password=self.config.password
+        )
+        url = reverse('metadata-list')
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 2)
+
+        internal_group = Group.objects.get(name='internal')
+        internal_group.permissions.add(Permission.objects.get(codename='view_internal'))
+        self.config.user_private.groups.add(internal_group)
+        response = self.client.get(url)
+        self.assertEqual(response.data['count'], 3, 'Access is read again when groups change')
+        self.assertTrue(has_perm(self.config.user_private, 'api.view_internal'))
+        with self.assertNumQueries(0):
+            self.assertTrue(has_perm(self.config.user_private, 'api.view_internal'))
+
+    def test_view_private_access_revoked(self):
+        self.client.login(
+            username=self.config.private_username,
+            password=self.config.password
+        )
+        url = reverse('metadata-list')
+        internal_group = Group.objects.get(name='internal')
+        view_internal = Permission.objects.get(codename='view_internal')
+        internal_group.permissions.add(view_internal)
+        self.config.user_private.groups.add(internal_group)
+        for ttl in (0, 60):
+            with self.subTest(ttl=ttl), self.settings(PERMISSIONS_CACHE_TTL=ttl):
+                internal_group.permissions.add(view_internal)
+                response = self.client.get(url)
+                self.assertEqual(response.data['count'], 3)
+                self.assertEqual(self.client.get(url).data['count'], 3)
+
+                internal_group.permissions.remove(view_internal)
+                response = self.client.get(url)
+                self.assertEqual(response.data['count'], 2, 'A revoked permission is not granted anymore')
+
+    def test_last_modified(self):
+        url = reverse('metadata-detail', kwargs={'id_name': self.config.public_metadata.id_name})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_changes_with_contacts(self):
+        url = reverse('metadata-detail', kwargs={'id_name': self.config.public_metadata.id_name})
+        response = self.client.get(url)
+        etag = response['ETag']
+        MetadataContact.objects.create(
+            metadata=self.config.public_metadata, contact_person=self.config.user_private.identity)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'New contact changes the ETag')
+
+        etag = response['ETag']
+        identity = self.config.user_private.identity
+        identity.phone = '+41 32 000 00 00'
+        identity.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'Contact change changes the ETag')
+
+        etag = response['ETag']
+        self.config.public_metadata.documents.add(
+            Document.objects.create(name='Document', link='https://example.com'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, 'New document changes the ETag')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_query_count(self):
+        """
+        Contacts, documents and other relations are prefetched: listing more metadata
+        doesn't cost more queries
+        """
+        copyright = Copyright.objects.create(description='Copyright')
+        document = Document.objects.create(name='Document', link='https://example.com')
+        for index in range(5):
+            metadata = Metadata.objects.create(
+                id_name='{:02d}_prefetched'.format(index + 10),
+                copyright=copyright,
+                modified_user=self.config.user_private,
+            )
+            metadata.documents.add(document)
+            MetadataContact.objects.create(
+                metadata=metadata, contact_person=self.config.user_private.identity)
+        url = reverse('metadata-list')
+
+        def count_queries(limit):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+            self.assertEqual(len(response.data['results']), limit)
+            return len(context.captured_queries)
+
+        count_queries(1)
+        self.assertEqual(count_queries(1), count_queries(6))
+        response = self.client.get(url, {'limit': 6})
+        contacts = [metadata['contact_persons'] for metadata in response.data['results']
+                    if metadata['id_name'].endswith('_prefetched')]
+        self.assertEqual(len(contacts), 5)
+        self.assertEqual(contacts[0][0]['metadata_role'], 'Manager')
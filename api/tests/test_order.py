@@ -1,8 +1,10 @@
 import json
 
+from django.db import connection
 from django.urls import reverse
 from django.core import mail
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 
 from math import isclose
 from django.contrib.gis.geos import Polygon
@@ -17,6 +19,7 @@ from api.models import (
   Metadata,
   Product,
   ProductFormat,
+  ProductOwnership,
 )
 from api.tests.factories import BaseObjectsFactory
 
@@ -566,6 +569,21 @@ class OrderTests(APITestCase):
         self.assertEqual(len(order["excludedGeom"]["coordinates"]), 1)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.content)
 
+    def test_excluded_areas_single_query(self):
+        geom = Polygon.from_bbox((2651783, 1246000, 2717522, 1252336))
+        geom.srid = 2056
+        products = [self.config.products['free'], self.config.products['single']]
+        with self.assertNumQueries(1):
+            areas, excludedGeom = ProductOwnership.get_excluded_areas(
+                geom, products, self.config.user_private)
+        pythonAreas, pythonExcludedGeom = ProductOwnership._get_excluded_areas_python(
+            geom, [product.id for product in products], self.config.user_private)
+        for product in products:
+            self.assertTrue(isclose(areas[product.id][0], pythonAreas[product.id][0]))
+            self.assertTrue(isclose(areas[product.id][1], pythonAreas[product.id][1]))
+        self.assertEqual(areas[self.config.products['single'].id], (geom.area, 0), 'Not owned')
+        self.assertTrue(isclose(excludedGeom.area, pythonExcludedGeom.area))
+
 
 @override_settings(LANGUAGE_CODE='en')
 class OrderValidationTests(APITestCase):
@@ -649,3 +667,37 @@ class OrderValidationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
         self.assertEqual(responseData['geom'], 'SRID=4326;POLYGON ((2545488 1203070, 2557441 1202601, 2557089 1210921, 2545605 1211390, 2545488 1203070))')
         self.assertEqual(responseData['excludedGeom'], 'SRID=2056;POLYGON ((2545605 1211390, 2557089 1210921, 2557441 1202601, 2545488 1203070, 2545605 1211390))')
+
+    def test_order_list_cursor_pagination(self):
+        date_ordered = self.config.order.date_ordered
+        for title in ['Draft 1', 'Draft 2', 'Same date']:
+            Order.objects.create(
+                client=self.config.user_private,
+                order_type=self.config.order_types['private'],
+                title=title,
+                geom=self.config.order.geom,
+                date_ordered=date_ordered if title == 'Same date' else None
+            )
+        expected = list(Order.objects.filter(
+            client=self.config.user_private).order_by('-date_ordered', '-pk').values_list('id', flat=True))
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.config.client_token)
+        url = '{}?cursor=&limit=1'.format(reverse('order-list'))
+        ids = []
+        with CaptureQueriesContext(connection) as context:
+            while url:
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+                self.assertNotIn('count', response.data)
+                ids += [order['id'] for order in response.data['results']]
+                url = response.data['next']
+        self.assertEqual(ids, expected)
+        self.assertTrue(
+            any('("order"."date_ordered", "order"."id") <' in query['sql'] for query in context.captured_queries),
+            'Pages after a dated order are found with a row comparison')
+
+        response = self.client.get(reverse('order-list'), {'count': 'false', 'limit': 2})
+        self.assertIsNone(response.data['count'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertIsNone(response.data['next'])
@@ -302,3 +302,15 @@ class PricingTests(APITestCase):
         self.assertEqual(self.config.order.processing_fee, Money(20, 'CHF'), 'Base fee is correct')
         self.assertEqual(self.config.order.total_without_vat,
                          self.number_of_objects * Money(1, 'CHF') + Money(150, 'CHF') + Money(20, 'CHF'))
+
+    def test_cart_prices_match_single_prices(self):
+        pricings = [
+            self.config.pricings[name] for name in (
+                'free', 'single', 'by_number_objects', 'by_area', 'from_pricing_layer', 'manual')
+        ]
+        with self.assertNumQueries(1):
+            cart_prices = Pricing.get_prices(self.config.order.geom, pricings)
+        for pricing in pricings:
+            self.assertEqual(
+                cart_prices[pricing.id], pricing.get_price(self.config.order.geom),
+                f'{pricing.pricing_type} cart price is the same as single price')
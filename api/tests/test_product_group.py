@@ -2,6 +2,7 @@ from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.contrib.gis.geos import Polygon, MultiPolygon
+from django.core import mail
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -109,6 +110,39 @@ class ProductGroupTests(APITestCase):
         self.assertEqual(len(response.data), 4, 'Check that all products are visible')
         self.assertTrue(all("id" in p["pricing"] for p in response.data["results"]))
 
+    def test_leaf_products(self):
+        """
+        Products of nested groups are found in a fixed number of queries,
+        only the ones intersecting the order are kept.
+        """
+        with self.assertNumQueries(3):
+            leaf_products = Product.get_leaf_products([self.group], self.config.order.geom)
+            formats = [
+                [product_format.data_format.name for product_format in product.product_formats.all()]
+                for product in leaf_products[self.group.id]
+            ]
+            pricings = [product.pricing.pricing_type for product in leaf_products[self.group.id]]
+        self.assertEqual(
+            [product.id for product in leaf_products[self.group.id]],
+            [self.products[0].id, self.products[1].id])
+        self.assertEqual(formats, [['DXF'], ['DWG']])
+        self.assertEqual(pricings, ['FREE', 'FREE'])
+
+    def test_group_in_cart_sends_no_email(self):
+        """
+        Pricings from children of a group are not computed as pricings of their own,
+        which would tell admins the pricing is not defined
+        """
+        self.group.pricing = self.config.pricings['from_children_of_group']
+        self.group.save()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer ' + self.config.client_token)
+        url = reverse('order-detail', kwargs={'pk': self.config.order.id})
+        response = self.client.patch(url, {'items': [{'product': {'label': self.group.label}}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(
+            response.data['items'][0]['price_status'], OrderItem.PricingStatus.CALCULATED, response.content)
+        self.assertEqual(len(mail.outbox), 0, 'No email is sent to admins')
+
     def test_groups_are_expanded_when_confirmed(self):
         """
         Client confirms an order with a `group` product.
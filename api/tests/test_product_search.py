@@ -0,0 +1,66 @@
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from api.models import Metadata, Product
+from api.tests.factories import BaseObjectsFactory
+
+
+class ProductSearchTests(APITestCase):
+    """
+    Test product search and autocomplete
+    """
+
+    def setUp(self):
+        self.config = BaseObjectsFactory()
+        self.product = self.config.products['single']
+        self.url = reverse('product-autocomplete')
+
+    def test_autocomplete_infix_and_typo(self):
+        for term in ['faitaire', 'forfaitaira']:
+            response = self.client.get(self.url, {'q': term})
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+            self.assertEqual(response.data[0]['label'], self.product.label, term)
+            self.assertGreater(response.data[0]['similarity'], 0)
+
+    def test_autocomplete_limit(self):
+        response = self.client.get(self.url, {'q': 'Produit', 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual(len(response.data), 1)
+        response = self.client.get(self.url, {'q': 'Produit', 'limit': 'all'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data, [])
+
+    def test_ranked_search_paginated_with_cursor(self):
+        metadata = Metadata.objects.create(
+            id_name='02_pipes',
+            description_long='Extrait du cadastre souterrain',
+            modified_user=self.config.user_private,
+            accessibility=Metadata.MetadataAccessibility.PUBLIC
+        )
+        in_description = Product.objects.create(
+            label='Plan des conduites',
+            pricing=self.config.pricings['single'],
+            metadata=metadata,
+            product_status=Product.ProductStatus.PUBLISHED,
+            provider=self.config.provider
+        )
+        in_label = Product.objects.create(
+            label='Cadastre souterrain',
+            pricing=self.config.pricings['single'],
+            metadata=self.config.public_metadata,
+            product_status=Product.ProductStatus.PUBLISHED,
+            provider=self.config.provider
+        )
+        url = reverse('product-list')
+        response = self.client.get(url, {'search': 'cadastre', 'rank': 'true', 'limit': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual([product['id'] for product in response.data['results']], [in_label.id])
+        self.assertIsNotNone(response.data['next'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.content)
+        self.assertEqual([product['id'] for product in response.data['results']], [in_description.id])
+        self.assertIsNone(response.data['next'])
+
+        response = self.client.get(url, {'search': 'cadastre', 'rank': 'true', 'cursor': 'wrong'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
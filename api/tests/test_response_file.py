@@ -81,7 +81,36 @@ class TestResponseFile(APITestCase):
         url = reverse("download_by_uuid", kwargs={"guid": ORDER_EXISTS_UUID})
         resp = self.client.get(url)
         self.assertEqual("11", resp.headers["Content-length"])
-        self.assertEqual(TMP_CONTENT, str(resp.content, "utf8"))
+        self.assertEqual(TMP_CONTENT, str(resp.getvalue(), "utf8"))
+
+    def testSendOrderFileRange(self):
+        url = reverse("download_by_uuid", kwargs={"guid": ORDER_EXISTS_UUID})
+        resp = self.client.get(url, HTTP_RANGE="bytes=6-")
+        self.assertEqual(resp.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual("bytes 6-10/11", resp.headers["Content-Range"])
+        self.assertEqual("5", resp.headers["Content-Length"])
+        self.assertEqual(TMP_CONTENT[6:], str(resp.getvalue(), "utf8"))
+
+        resp = self.client.get(url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(TMP_CONTENT[-5:], str(resp.getvalue(), "utf8"))
+
+        resp = self.client.get(url, HTTP_RANGE="bytes=20-")
+        self.assertEqual(resp.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+    def testSendOrderFileNotModified(self):
+        url = reverse("download_by_uuid", kwargs={"guid": ORDER_EXISTS_UUID})
+        etag = self.client.get(url).headers["ETag"]
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(b"", resp.content)
+
+    @override_settings(DOWNLOAD_OFFLOAD_HEADER="X-Accel-Redirect", DOWNLOAD_OFFLOAD_URL="/protected/")
+    def testSendOrderFileOffloaded(self):
+        url = reverse("download_by_uuid", kwargs={"guid": ORDER_EXISTS_UUID})
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual("/protected/demo_file", resp.headers["X-Accel-Redirect"])
+        self.assertEqual(b"", resp.content)
 
     def testSendOrderNotFound(self):
         url = reverse("download_by_uuid", kwargs={"guid": ORDER_NOTFOUND_UUID})
@@ -99,7 +128,7 @@ class TestResponseFile(APITestCase):
         url = reverse("download_by_uuid", kwargs={"guid": ITEM_EXISTS_UUID})
         resp = self.client.get(url)
         self.assertEqual("11", resp.headers["Content-length"])
-        self.assertEqual(TMP_CONTENT[::-1], str(resp.content, "utf8"))
+        self.assertEqual(TMP_CONTENT[::-1], str(resp.getvalue(), "utf8"))
 
     def testSendItemNotFound(self):
         url = reverse("download_by_uuid", kwargs={"guid": ITEM_NOTFOUND_UUID})
@@ -25,3 +25,26 @@ class ZipTest(TestCase):
         zip_file2.close()
 
         _zip_them_all('{}/full_zip.zip'.format(settings.MEDIA_ROOT), ['zip1.zip', 'zip2.zip', 'file.txt'])
+        with zipfile.ZipFile('{}/full_zip.zip'.format(settings.MEDIA_ROOT)) as full_zip:
+            self.assertIsNone(full_zip.testzip(), 'Check copied members are not corrupted')
+            self.assertEqual(full_zip.namelist(), ['file.txt', 'file_1.txt', 'file_2.txt'])
+            self.assertEqual(full_zip.read('file_1.txt'), Path(self.file.name).read_bytes())
+
+    def test_zip_members_copied_as_is(self):
+        with zipfile.ZipFile('{}/zip3.zip'.format(settings.MEDIA_ROOT), 'w') as zip_file3:
+            zip_file3.writestr('folder/', '')
+            zip_file3.writestr('folder/deflated.txt', 'abc' * 1000, zipfile.ZIP_DEFLATED)
+            zip_file3.writestr('stored.txt', 'abc' * 1000, zipfile.ZIP_STORED)
+        raster_path = Path(settings.MEDIA_ROOT, 'raster.tif')
+        raster_path.write_bytes(b'II*\x00' + bytes(1000))
+
+        _zip_them_all('{}/full_zip2.zip'.format(settings.MEDIA_ROOT), ['zip3.zip', 'raster.tif'])
+        with zipfile.ZipFile('{}/zip3.zip'.format(settings.MEDIA_ROOT)) as source, \
+                zipfile.ZipFile('{}/full_zip2.zip'.format(settings.MEDIA_ROOT)) as full_zip:
+            self.assertIsNone(full_zip.testzip())
+            for info in source.infolist():
+                copied = full_zip.getinfo(info.filename)
+                self.assertEqual(copied.compress_type, info.compress_type)
+                self.assertEqual(copied.compress_size, info.compress_size)
+                self.assertEqual(full_zip.read(info.filename), source.read(info.filename))
+            self.assertEqual(full_zip.getinfo('raster.tif').compress_type, zipfile.ZIP_STORED)
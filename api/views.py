@@ -1,12 +1,19 @@
-import mimetypes
+import hashlib
+import logging
+from datetime import timedelta
 from pathlib import Path
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import OperationalError, connection, transaction
+from django.db.models import Prefetch, Q
+from django.http import Http404
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.utils import timezone, translation
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
 from django.utils.translation import gettext_lazy as _
 from django.views.decorators.debug import sensitive_post_parameters
 
@@ -17,10 +24,12 @@ from rest_framework.response import Response
 from rest_framework.renderers import TemplateHTMLRenderer
 from rest_framework.parsers import MultiPartParser
 
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 
 from allauth.account.views import ConfirmEmailView
 
+from psycopg2 import errorcodes
+
 from .models import (
     Contact, Copyright, Document, DataFormat, Identity, Metadata, MetadataContact,
     Order, OrderItem, OrderType, Pricing, Product,
@@ -33,15 +42,18 @@ from .serializers import (
     MetadataSerializer, MetadataContactSerializer, OrderDigestSerializer,
     OrderSerializer, OrderItemSerializer, OrderItemValidationSerializer, OrderTypeSerializer,
     PasswordResetSerializer, PasswordResetConfirmSerializer,
-    PricingSerializer, ProductSerializer, ProductDigestSerializer, PublicOrderSerializer,
+    PricingSerializer, ProductAutocompleteSerializer, ProductSerializer, ProductDigestSerializer,
+    PublicOrderSerializer,
     ProductFormatSerializer, RegisterSerializer, UserChangeSerializer,
     VerifyEmailSerializer, ValidationSerializer, UntypedOrderSerializer)
 
-from .helpers import send_geoshop_email
+from . import catalogue
+from .helpers import file_response, send_geoshop_email
 
 from .filters import FullTextSearchFilter
+from .pagination import KeysetPagination, LimitOffsetOrCursorPagination
 
-from .permissions import ExtractGroupPermission, InternalGroupObjectPermission
+from .permissions import ExtractGroupPermission, InternalGroupObjectPermission, has_perm
 
 sensitive_post_parameters_m = method_decorator(
     sensitive_post_parameters(
@@ -51,6 +63,149 @@ sensitive_post_parameters_m = method_decorator(
 
 UserModel = get_user_model()
 
+LOGGER = logging.getLogger(__name__)
+
+
+class CatalogueCacheMixin():
+    """
+    Lists and retrieves catalogue objects from the tables kept in memory by the
+    process (see catalogue.py) instead of querying the database.
+    Searches still query the database.
+    """
+
+    def get_catalogue_table(self):
+        if self.request.query_params.get(FullTextSearchFilter.search_param):
+            return None
+        return catalogue.table(self.get_queryset().model)
+
+    def filter_catalogue(self, instances):
+        """
+        Counterpart of get_queryset for the rows kept in memory
+        """
+        return list(instances)
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_catalogue_table()
+        if rows is None:
+            return super().list(request, *args, **kwargs)
+        instances = self.filter_catalogue(rows.values())
+        page = self.paginate_queryset(instances)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(instances, many=True)
+        return Response(serializer.data)
+
+    def get_object(self):
+        rows = self.get_catalogue_table()
+        if rows is None:
+            return super().get_object()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(self.kwargs[lookup_url_kwarg])
+        except DjangoValidationError:
+            raise Http404
+        instance = rows.get(pk)
+        if instance is None or not self.filter_catalogue([instance]):
+            raise Http404
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+
+class ConditionalCatalogueMixin():
+    """
+    Answers conditional GET on catalogue endpoints. The ETag derives from the
+    catalogue version, so 304 Not Modified is returned before anything is
+    fetched or serialized.
+    """
+
+    def get_etag_variant(self, request):
+        """
+        Returns what the response depends on for the current user
+        """
+        return ''
+
+    def get_etag(self, request):
+        last_change = catalogue.last_change()
+        if last_change is None:
+            return None
+        key = '|'.join([
+            str(last_change[0]),
+            request.build_absolute_uri(),
+            request.accepted_renderer.format,
+            translation.get_language() or '',
+            self.get_etag_variant(request),
+        ])
+        return quote_etag(hashlib.sha256(key.encode()).hexdigest())
+
+    def get_last_modified(self, request):
+        last_change = catalogue.last_change()
+        return last_change[1] if last_change else None
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        last_modified = self.get_last_modified(request)
+        last_modified = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+        response = handler(request, *args, **kwargs)
+        if 200 <= response.status_code < 300:
+            if etag:
+                response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
+
+
+class SearchResponseCacheMixin():
+    """
+    Keeps the responses to anonymous searches in memory, keyed by the sanitized
+    search term, the page and the catalogue version. Search-as-you-type sends
+    the same prefixes over and over again.
+    """
+    search_cache = catalogue.LRUCache(settings.PRODUCT_SEARCH_CACHE_SIZE)
+
+    def get_search_cache_key(self, request):
+        if not request.user.is_anonymous:
+            return None
+        search_term = FullTextSearchFilter().get_search_term(request)
+        version = catalogue.version()
+        if not search_term or version is None:
+            return None
+        if isinstance(self.paginator, KeysetPagination):
+            page = request.query_params.get(self.paginator.cursor_query_param)
+        else:
+            page = self.paginator.get_offset(request) if self.paginator else None
+        return (
+            search_term.lower(),
+            FullTextSearchFilter().is_ranked(request),
+            page,
+            self.paginator.get_limit(request) if self.paginator else None,
+            version,
+            translation.get_language(),
+            request.scheme,
+            request.get_host(),
+        )
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_search_cache_key(request)
+        if key is None:
+            return super().list(request, *args, **kwargs)
+        data = self.search_cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            self.search_cache.set(key, response.data)
+        return response
+
 
 class CopyrightViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -74,6 +229,7 @@ class ContactViewSet(mixins.CreateModelMixin,
     filter_backends = [filters.SearchFilter]
     serializer_class = ContactSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LimitOffsetOrCursorPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -110,7 +266,7 @@ class DocumentViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
 
 
-class DataFormatViewSet(viewsets.ReadOnlyModelViewSet):
+class DataFormatViewSet(ConditionalCatalogueMixin, CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows Format to be viewed.
     """
@@ -139,7 +295,7 @@ class IdentityViewSet(viewsets.ReadOnlyModelViewSet):
         return Identity.objects.filter(Q(user_id=user.id) | Q(is_public=True))
 
 
-class MetadataViewSet(viewsets.ReadOnlyModelViewSet):
+class MetadataViewSet(ConditionalCatalogueMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows Metadata to be viewed.
     `public` and `approval needed` metadatas can be viewed by everyone.
@@ -167,12 +323,24 @@ class MetadataViewSet(viewsets.ReadOnlyModelViewSet):
         response['Content-Security-Policy'] = 'frame-ancestors *'
         return response
 
+    def get_etag_variant(self, request):
+        return str(has_perm(request.user, 'api.view_internal'))
+
     def get_queryset(self):
         user = self.request.user
-        has_permision = user.has_perm('api.view_internal')
+        queryset = Metadata.objects.select_related(
+            'ech_category', 'copyright', 'modified_user'
+        ).prefetch_related(
+            'documents',
+            Prefetch(
+                'metadatacontact_set',
+                queryset=MetadataContact.objects.select_related('contact_person').order_by('pk')
+            ),
+        )
+        has_permision = has_perm(user, 'api.view_internal')
         if has_permision:
-            return Metadata.objects.all()
-        return Metadata.objects.filter(accessibility__in=settings.METADATA_PUBLIC_ACCESSIBILITIES)
+            return queryset
+        return queryset.filter(accessibility__in=settings.METADATA_PUBLIC_ACCESSIBILITIES)
 
     def get_serializer_context(self):
         context = super(MetadataViewSet, self).get_serializer_context()
@@ -204,6 +372,7 @@ class OrderItemViewSet(viewsets.ModelViewSet):
     """
     serializer_class = OrderItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LimitOffsetOrCursorPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -239,7 +408,7 @@ class OrderItemViewSet(viewsets.ModelViewSet):
         return Response(status=status.HTTP_404_NOT_FOUND)
 
 
-class OrderTypeViewSet(viewsets.ReadOnlyModelViewSet):
+class OrderTypeViewSet(ConditionalCatalogueMixin, CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows OrderType to be viewed.
     """
@@ -265,6 +434,9 @@ class OrderViewSet(MultiSerializerMixin, viewsets.ModelViewSet):
     `PUT` or `PATCH` data doesn't mention it, then the existing item is deleted.
 
     To modify or delete an existing item, please use `/orderitem/` endpoint.
+
+    Long order histories can be paginated with `?cursor=` (empty for the first page)
+    instead of an offset, and `?count=false` skips counting all the orders.
     """
     search_fields = ['title', 'description', 'id']
     ordering_fields = ['id']
@@ -274,6 +446,7 @@ class OrderViewSet(MultiSerializerMixin, viewsets.ModelViewSet):
         'list':    OrderDigestSerializer,
     }
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LimitOffsetOrCursorPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -357,21 +530,69 @@ class ExtractOrderView(views.APIView):
     API endpoint that allows Orders to be fetched by Extract.
     This endpoint searches for orderitems belonging to current Extract user and
     rebuilds Order context around the order item for each matched order item.
+    Items are leased to the Extract instance given by the `worker` parameter and
+    handed out again if no result is uploaded before EXTRACT_LEASE_DURATION.
     """
     permission_classes = [ExtractGroupPermission]
 
-    # def
-    @extend_schema(responses=ExtractOrderSerializer)
+    @extend_schema(
+        responses=ExtractOrderSerializer,
+        parameters=[
+            OpenApiParameter('limit', int, description='Maximum number of order items to fetch'),
+            OpenApiParameter('worker', str, description='Identifier of the Extract instance fetching items'),
+        ])
     def get(self, request, *args, **kwargs):
-        # Start by getting orderitems that are PENDING and that will be extracted by current user
-        order_items = OrderItem.objects.filter(
-            (
-                Q(order__order_status=Order.OrderStatus.READY) |
-                Q(order__order_status=Order.OrderStatus.PARTIALLY_DELIVERED)
-            ) &
-            Q(product__provider=request.user) &
-            Q(status=OrderItem.OrderItemStatus.PENDING)
-        ).order_by('order_id').all()
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                raise ValidationError({'limit': [_('A positive integer is required.')]})
+        worker = request.query_params.get('worker') or request.user.username
+        now = timezone.now()
+        # PENDING items, or items of an Extract instance that didn't deliver before its lease expired
+        available = Q(status=OrderItem.OrderItemStatus.PENDING)
+        if settings.EXTRACT_LEASE_DURATION:
+            available |= Q(
+                status=OrderItem.OrderItemStatus.IN_EXTRACT,
+                extract_lease_expiry__lt=now)
+        with transaction.atomic():
+            # Start by getting orderitems that will be extracted by current user.
+            # Items locked by another Extract instance polling at the same time are skipped
+            order_items = OrderItem.objects.select_related(
+                'data_format',
+                'order__order_type',
+                'order__client__identity',
+                'order__invoice_contact',
+                'product__pricing',
+                'product__metadata',
+                'product__provider__identity',
+            ).select_for_update(skip_locked=True, of=('self',)).filter(
+                (
+                    Q(order__order_status=Order.OrderStatus.READY) |
+                    Q(order__order_status=Order.OrderStatus.PARTIALLY_DELIVERED)
+                ) &
+                Q(product__provider=request.user) &
+                available
+            ).order_by('order_id', 'id')
+            if limit:
+                order_items = order_items[:limit]
+            order_items = list(order_items)
+            if len(order_items) == 0:
+                return Response(status=status.HTTP_204_NO_CONTENT)
+            # Once fetched by extract, status of items changes
+            OrderItem.objects.filter(
+                pk__in=[item.pk for item in order_items]
+            ).update(
+                status=OrderItem.OrderItemStatus.IN_EXTRACT,
+                extract_worker=worker[:100],
+                extract_lease_expiry=(
+                    now + timedelta(seconds=settings.EXTRACT_LEASE_DURATION)
+                    if settings.EXTRACT_LEASE_DURATION else None
+                ))
+
         response_data = []
         order_data = { 'id': None }
         for item in order_items:
@@ -384,14 +605,8 @@ class ExtractOrderView(views.APIView):
 
             # Serialize order item
             item_serializer = ExtractOrderItemSerializer(item)
-            item_data = item_serializer.data
             # Replace items in the order by the only concerned item
-            order_data['items'].append(item_data)
-            # Once fetched by extract, status of item changes
-            item.status = OrderItem.OrderItemStatus.IN_EXTRACT
-            item.save()
-        if len(response_data) == 0:
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            order_data['items'].append(item_serializer.data)
         return Response(response_data)
 
 
@@ -474,17 +689,25 @@ class ProductFormatViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.DjangoModelPermissionsOrAnonReadOnly]
 
 
-class ProductViewSet(MultiSerializerMixin, viewsets.ReadOnlyModelViewSet):
+class ProductViewSet(ConditionalCatalogueMixin, SearchResponseCacheMixin, CatalogueCacheMixin,
+                     MultiSerializerMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows Product to be viewed.
 
     You can search a product with `?search=` param.
     Searchable properties are:
      - label
+     - description of the metadata
+
+    Add `?rank=true` to get the most relevant products first, label matches
+    weighing more than description ones. Ranked results are paginated with a
+    `cursor` instead of an offset.
     """
     querysets = {
         'default': Product.objects.all(),
-        'list': Product.objects.filter(product_status=Product.ProductStatus.PUBLISHED)
+        'list': Product.objects.filter(
+            product_status=Product.ProductStatus.PUBLISHED
+        ).select_related('metadata', 'pricing', 'provider__identity')
     }
     filter_backends = (FullTextSearchFilter,)
     serializers = {
@@ -497,8 +720,64 @@ class ProductViewSet(MultiSerializerMixin, viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return self.querysets.get(self.action, self.querysets['default'])
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter('q', str, description=_('Part of a product label or metadata name')),
+            OpenApiParameter('limit', int, description=_('Maximum number of suggestions')),
+        ],
+        responses=ProductAutocompleteSerializer(many=True),
+    )
+    @action(detail=False, pagination_class=None, filter_backends=[])
+    def autocomplete(self, request):
+        """
+        Suggests published products whose label or metadata name contains the
+        searched text or looks like it (typos), the most similar first.
+        Relies on trigram indexes and gives up after PRODUCT_AUTOCOMPLETE_TIMEOUT
+        milliseconds, returning no suggestion rather than a slow answer.
+        """
+        term = request.query_params.get('q', '').replace('\x00', '').strip()
+        try:
+            limit = min(int(request.query_params.get('limit', settings.PRODUCT_AUTOCOMPLETE_LIMIT)),
+                        settings.PRODUCT_AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            raise ValidationError({'limit': [_('A positive integer is required.')]})
+        if not term or limit < 1:
+            return Response([])
+        queryset = Product.search_similar(term)[:limit]
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL statement_timeout = %s', [settings.PRODUCT_AUTOCOMPLETE_TIMEOUT])
+                products = list(queryset)
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL statement_timeout TO DEFAULT')
+        except OperationalError as error:
+            if getattr(error.__cause__, 'pgcode', None) != errorcodes.QUERY_CANCELED:
+                raise
+            LOGGER.warning('Product autocomplete for "%s" took too long', term)
+            products = []
+        return Response(ProductAutocompleteSerializer(products, many=True).data)
+
+    @property
+    def paginator(self):
+        """
+        Searches ranked by relevance are paginated with a cursor
+        """
+        if (not hasattr(self, '_paginator') and self.request is not None
+                and FullTextSearchFilter().is_ranked(self.request)):
+            self._paginator = KeysetPagination()
+        return super().paginator
+
+    def filter_catalogue(self, instances):
+        if self.action == 'list':
+            return [
+                product for product in instances
+                if product.product_status == Product.ProductStatus.PUBLISHED
+            ]
+        return list(instances)
+
 
-class PricingViewSet(viewsets.ReadOnlyModelViewSet):
+class PricingViewSet(ConditionalCatalogueMixin, CatalogueCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows Pricing to be viewed.
     """
@@ -615,23 +894,10 @@ class DownloadView(generics.RetrieveAPIView):
         if instance.extract_result:
             file = Path(settings.MEDIA_ROOT, instance.extract_result.name)
             if file.is_file():
-                (actualType, unused) = mimetypes.guess_type(file)
-                with open(file, 'rb') as result:
-                    response = Response(
-                        headers={
-                            'Content-Length': file.stat().st_size,
-                            'Content-Disposition': f'attachment; filename="{file.name}"',
-                            'Content-Type': actualType if actualType else 'application/octet-stream'
-                        },
-                    )
-                    response.content = result.read()
-                    return response
-            else:
-                return Response(
-                    {"detail": _("Zip file not found")},
-                    status=status.HTTP_404_NOT_FOUND)
-            instance.date_downloaded = timezone.now()
-            instance.save()
+                return file_response(request, file)
+            return Response(
+                {"detail": _("Zip file not found")},
+                status=status.HTTP_404_NOT_FOUND)
         return Response(status=status.HTTP_404_NOT_FOUND)
 
 class UserChangeView(generics.CreateAPIView):
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.gis',
+    'django.contrib.postgres',
     'django.contrib.sessions',
     'django.contrib.sites',
     'django.contrib.messages',
@@ -76,6 +77,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.catalogue.CatalogueScopeMiddleware',
 ]
 
 ROOT_URLCONF = 'urls'
@@ -223,6 +225,20 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
 }
 
+# Authenticate JWT requests from the claims of the token instead of reading the user
+# from the database. Deactivated users keep their access until their token expires
+JWT_STATELESS_AUTHENTICATION = os.environ.get("JWT_STATELESS_AUTHENTICATION", "False") == "True"
+if JWT_STATELESS_AUTHENTICATION:
+    REST_FRAMEWORK['DEFAULT_AUTHENTICATION_CLASSES'] = (
+        'api.authentication.StatelessJWTAuthentication',
+        'rest_framework.authentication.SessionAuthentication',
+    )
+
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'api.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'api.authentication.ClaimsTokenRefreshSerializer',
+}
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'geoshop API',
     'DESCRIPTION': 'API for the geoshop',
@@ -353,6 +369,8 @@ if check_oidc():
         OIDC_OP_BASE_URL + "/.well-known/openid-configuration"
     )
     OIDC_INTROSPECT_URL = discovery_info["introspection_endpoint"]
+    # Seconds a token introspection result is reused, at most until the token expires
+    OIDC_INTROSPECTION_CACHE_TTL = int(os.environ.get("OIDC_INTROSPECTION_CACHE_TTL", "300"))
     OIDC_OP_AUTHORIZATION_ENDPOINT = discovery_info["authorization_endpoint"]
     OIDC_OP_TOKEN_ENDPOINT = discovery_info["token_endpoint"]
     OIDC_OP_USER_ENDPOINT = discovery_info["userinfo_endpoint"]
@@ -390,3 +408,58 @@ MAX_ORDER_AREA=float(os.environ.get("MAX_ORDER_AREA", "0"))
 
 # 25 Megabytes
 DATA_UPLOAD_MAX_MEMORY_SIZE=int(os.environ.get("DATA_UPLOAD_MAX_MEMORY_SIZE", "26214400"))
+
+# Extract results are streamed by chunks of this size (in bytes) when downloaded
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", "1048576"))
+# Hands over download of extract results to the reverse proxy instead of streaming them.
+# Empty to stream from Django, "X-Accel-Redirect" for nginx or "X-Sendfile" for apache
+DOWNLOAD_OFFLOAD_HEADER = os.environ.get("DOWNLOAD_OFFLOAD_HEADER", "")
+# Internal location of MEDIA_ROOT on the reverse proxy, only used with X-Accel-Redirect
+DOWNLOAD_OFFLOAD_URL = os.environ.get("DOWNLOAD_OFFLOAD_URL", "/protected/")
+
+# Background jobs run by `manage.py run_workers`
+JOBS_POOL_SIZE = int(os.environ.get("JOBS_POOL_SIZE", "2"))
+# Seconds between two polls of the queue when it is empty
+JOBS_POLL_INTERVAL = float(os.environ.get("JOBS_POLL_INTERVAL", "5"))
+JOBS_MAX_ATTEMPTS = int(os.environ.get("JOBS_MAX_ATTEMPTS", "5"))
+# Seconds before the first retry of a failed job, doubled on each attempt
+JOBS_RETRY_DELAY = int(os.environ.get("JOBS_RETRY_DELAY", "30"))
+# Seconds after which a running job is considered lost and is taken again
+JOBS_LEASE_DURATION = int(os.environ.get("JOBS_LEASE_DURATION", "3600"))
+
+# Emails are stored in an outbox and sent by `manage.py run_workers` instead of during requests
+EMAIL_OUTBOX_ENABLED = os.environ.get("EMAIL_OUTBOX_ENABLED", "False") == "True"
+# Emails sent over a single SMTP connection
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", "100"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", "8"))
+# Seconds before sending a failed email again, doubled on each attempt
+EMAIL_OUTBOX_RETRY_DELAY = int(os.environ.get("EMAIL_OUTBOX_RETRY_DELAY", "60"))
+
+# Seconds an Extract instance has to deliver an order item before it is handed out again.
+# 0 keeps items in extract until a result is uploaded
+EXTRACT_LEASE_DURATION = int(os.environ.get("EXTRACT_LEASE_DURATION", "604800"))
+
+# Number of order geometries whose simplified WGS84 representation is kept in memory
+GEOMETRY_REPRESENTATION_CACHE_SIZE = int(os.environ.get("GEOMETRY_REPRESENTATION_CACHE_SIZE", "512"))
+
+# Catalogue tables (products, pricings, formats...) are kept in memory by each process
+# and reloaded when the catalogue version stored in the database changes
+CATALOGUE_CACHE_ENABLED = os.environ.get("CATALOGUE_CACHE_ENABLED", "True") == "True"
+# Number of responses to anonymous product searches kept in memory, 0 to disable
+PRODUCT_SEARCH_CACHE_SIZE = int(os.environ.get("PRODUCT_SEARCH_CACHE_SIZE", "512"))
+
+# Seconds the groups and permissions of a user are kept in the cache, 0 to read them
+# once per request. Changes only clear the cache of the process making them: without
+# a CACHES backend shared by all processes, the others keep granting a revoked
+# permission for up to PERMISSIONS_CACHE_TTL seconds.
+PERMISSIONS_CACHE_TTL = int(os.environ.get("PERMISSIONS_CACHE_TTL", "0"))
+
+# Product autocomplete: default and maximum number of suggestions,
+# milliseconds after which the query is cancelled and nothing is suggested
+PRODUCT_AUTOCOMPLETE_LIMIT = int(os.environ.get("PRODUCT_AUTOCOMPLETE_LIMIT", "10"))
+PRODUCT_AUTOCOMPLETE_MAX_LIMIT = int(os.environ.get("PRODUCT_AUTOCOMPLETE_MAX_LIMIT", "50"))
+PRODUCT_AUTOCOMPLETE_TIMEOUT = int(os.environ.get("PRODUCT_AUTOCOMPLETE_TIMEOUT", "300"))
+
+# Weights of the categories D, C, B and A of the product search vectors when ranking results.
+# Labels are in category A and metadata descriptions in category B
+FTS_RANK_WEIGHTS = [float(weight) for weight in os.environ.get("FTS_RANK_WEIGHTS", "0.1,0.2,0.4,1.0").split(",")]
@@ -1,17 +1,21 @@
+import hashlib
 import json
+import os
+import threading
 import requests
 import time
 
 from django.views.generic import View
-from rest_framework_simplejwt.tokens import RefreshToken
 from mozilla_django_oidc.auth import OIDCAuthenticationBackend
-from authlib.jose import jwt
+from authlib.jose import JsonWebKey, jwt
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
 from django.contrib.auth import get_user_model
 from rest_framework.request import Request
+from api.authentication import ClaimsRefreshToken
 from api.models import Identity
 
 UserModel = get_user_model()
@@ -19,6 +23,14 @@ UserModel = get_user_model()
 _defaultLanguage = 'de'
 _supportedLanguages = ['de', 'fr', 'en']
 
+# Connections to the identity provider are pooled and kept alive between requests
+_session = requests.Session()
+
+# Lifetime of the client assertions signed to call the introspection endpoint,
+# and seconds before their expiry they are replaced by a new one
+CLIENT_ASSERTION_LIFETIME = 3600
+CLIENT_ASSERTION_RENEWAL_MARGIN = 60
+
 def status(request):
     return {"OIDC_ENABLED": settings.FEATURE_FLAGS["oidc"]}
 
@@ -48,31 +60,97 @@ def _read_private_key(keyfile):
         return {
             "client_id": data["clientId"],
             "key_id": data["keyId"],
-            "private_key": data["key"],
+            "private_key": JsonWebKey.import_key(data["key"], {"kty": "RSA"}),
         }
 
 
+class PrivateKeyStore:
+    """
+    Private key of the client, read and parsed once per process.
+    The file is read again when its modification time changes.
+    """
+
+    def __init__(self, keyfile):
+        self.keyfile = keyfile
+        self._key = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns the private key and the modification time of the file it was read from
+        """
+        mtime = os.stat(self.keyfile).st_mtime_ns
+        with self._lock:
+            if self._key is None or mtime != self._mtime:
+                self._key = _read_private_key(self.keyfile)
+                self._mtime = mtime
+            return self._key, self._mtime
+
+
+_private_keys = {}
+_private_keys_lock = threading.Lock()
+
+
+def get_private_key_store(keyfile):
+    with _private_keys_lock:
+        if keyfile not in _private_keys:
+            _private_keys[keyfile] = PrivateKeyStore(keyfile)
+        return _private_keys[keyfile]
+
+
+def _introspection_cache_timeout(user_data):
+    """
+    Seconds an introspection result can be reused: OIDC_INTROSPECTION_CACHE_TTL,
+    never beyond the expiry of the token. Inactive tokens are not kept.
+    """
+    if not user_data.get("active", True):
+        return 0
+    timeout = settings.OIDC_INTROSPECTION_CACHE_TTL
+    if "exp" in user_data:
+        timeout = min(timeout, int(user_data["exp"] - time.time()))
+    return timeout
+
+
 class FrontendAuthentication(View):
+    # Client assertion shared by the requests of the process, with its expiry
+    # and the version of the key it was signed with
+    _client_assertion = (None, 0, None)
+    _client_assertion_lock = threading.Lock()
 
     def __init__(self):
         super().__init__()
-        self.private_key = _read_private_key(settings.OIDC_PRIVATE_KEYFILE)
+        self.private_key_store = get_private_key_store(settings.OIDC_PRIVATE_KEYFILE)
 
     def _get_jwt_token(self):
-        return jwt.encode(
-            {"alg": "RS256", "kid": self.private_key["key_id"]},
-            {
-                "iss": self.private_key["client_id"],
-                "sub": self.private_key["client_id"],
-                "aud": settings.OIDC_OP_BASE_URL,
-                "exp": int(time.time() + 3600),
-                "iat": int(time.time()),
-            },
-            self.private_key["private_key"],
-        )
+        private_key, key_version = self.private_key_store.get()
+        with self._client_assertion_lock:
+            assertion, expiry, assertion_key_version = FrontendAuthentication._client_assertion
+            now = time.time()
+            if (assertion is None or assertion_key_version != key_version
+                    or expiry - CLIENT_ASSERTION_RENEWAL_MARGIN <= now):
+                expiry = int(now + CLIENT_ASSERTION_LIFETIME)
+                assertion = jwt.encode(
+                    {"alg": "RS256", "kid": private_key["key_id"]},
+                    {
+                        "iss": private_key["client_id"],
+                        "sub": private_key["client_id"],
+                        "aud": settings.OIDC_OP_BASE_URL,
+                        "exp": expiry,
+                        "iat": int(now),
+                    },
+                    private_key["private_key"],
+                )
+                FrontendAuthentication._client_assertion = (assertion, expiry, key_version)
+            return assertion
 
     def _resolve_user_data(self, token: str):
-        resp = requests.post(
+        # Only a hash of the token is stored
+        cache_key = "oidc-introspection-" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+        user_data = cache.get(cache_key)
+        if user_data is not None:
+            return user_data
+        resp = _session.post(
             settings.OIDC_INTROSPECT_URL,
             headers={"Content-Type": "application/x-www-form-urlencoded"},
             data={
@@ -82,7 +160,11 @@ class FrontendAuthentication(View):
             },
         )
         resp.raise_for_status()
-        return json.loads(resp.content)
+        user_data = json.loads(resp.content)
+        timeout = _introspection_cache_timeout(user_data)
+        if timeout > 0:
+            cache.set(cache_key, user_data, timeout)
+        return user_data
 
     @method_decorator(csrf_exempt)
     def dispatch(self, request, *args, **kwargs):
@@ -101,12 +183,14 @@ class FrontendAuthentication(View):
             return JsonResponse({"error": "No token provided"}, status=400)
 
         user_data = self._resolve_user_data(token_data["token"])
+        if not user_data.get("active", True):
+            return JsonResponse({"error": "Token is not active"}, status=401)
         try:
             user = UserModel.objects.get(username=user_data["email"])
         except UserModel.DoesNotExist:
             user = UserModel.objects.create_user(username=user_data["email"])
         _updateUser(user, user_data)
-        token = RefreshToken.for_user(user)
+        token = ClaimsRefreshToken.for_user(user)
         return JsonResponse({"access": str(token.access_token), "refresh": str(token)})
 
 